@@ -0,0 +1,166 @@
+# analysis.py
+#
+# Adaptive timing analysis of GEM runs: how tappers and the adaptive metronome correct each other's timing. All
+# estimates are computed for every run and tapper of a file at once, from the stacked (runs x windows x tappers)
+# asynchronies and (runs x windows) metronome adjustments.
+#
+# Phase correction is estimated from the linear phase correction model. If a tapper's next tap follows their previous
+# tap by their period minus a fraction alpha of their asynchrony, and the metronome's next click follows its previous
+# click by its period plus next_met_adjust, then
+#
+#   A[n+1] - A[n] + next_met_adjust[n] = c - alpha*A[n] + noise
+#
+# where A is the tapper's asynchrony and c is the difference between the tapper's and the metronome's periods.
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import pdb
+
+# Lags at which asynchronies are correlated with the metronome adjustments, in windows. At lag k, A[n] is paired with
+# next_met_adjust[n+k], so lag 0 shows the metronome responding to the asynchrony, and lag -1 the asynchrony
+# following the previous adjustment.
+DEFAULT_XCORR_LAGS = [-1, 0, 1]
+
+TAPPER_ANALYSIS = ['lag1_autocorr', 'phase_correction', 'period_offset', 'phase_correction_resid_std', 'phase_correction_n']
+RUN_ANALYSIS = ['metronome_gain', 'metronome_offset']
+
+
+# Pair x[..., n] with y[..., n+lag] along the last axis
+def shift_pair(x, y, lag):
+    nwindows = x.shape[-1]
+
+    if lag >= 0:
+        return x[..., :nwindows-lag], y[..., lag:]
+
+    return x[..., -lag:], y[..., :nwindows+lag]
+
+
+def nan_regress(x, y):
+    '''
+    Least-squares fit of y = intercept + slope*x along the last axis, using the pairs in which neither value is NaN.
+    Returns the slope, intercept, correlation, residual standard deviation, and number of pairs. Estimates that
+    can't be made from the available pairs are NaN.
+    '''
+    x, y = np.broadcast_arrays(x, y)
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    n = valid.sum(axis=-1)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+
+        mx = np.where(valid, x, 0).sum(axis=-1)/n
+        my = np.where(valid, y, 0).sum(axis=-1)/n
+
+        dx = np.where(valid, x - mx[..., np.newaxis], 0)
+        dy = np.where(valid, y - my[..., np.newaxis], 0)
+
+        sxx = (dx**2).sum(axis=-1)
+        syy = (dy**2).sum(axis=-1)
+        sxy = (dx*dy).sum(axis=-1)
+
+        slope = sxy/sxx
+        intercept = my - slope*mx
+        corr = sxy/np.sqrt(sxx*syy)
+        resid_std = np.sqrt(np.maximum(syy - slope*sxy, 0)/(n-2))
+
+    enough = n > 2
+    slope, intercept, corr, resid_std = [np.where(enough & np.isfinite(value), value, np.nan) for value in [slope, intercept, corr, resid_std]]
+
+    return slope, intercept, corr, resid_std, n
+
+
+def estimate_adaptive_timing(asynchronies, next_met_adjust, num_pacing_clicks=0, lags=DEFAULT_XCORR_LAGS):
+    '''
+    Estimate the adaptive timing parameters for a stack of runs.
+
+    asynchronies is a (runs x windows x tappers) float array with missing values set to NaN, containing only the valid tappers.
+    next_met_adjust is a (runs x windows) array.
+
+    Returns a dict of arrays. Per-tapper estimates are (runs x tappers), per-lag cross-correlations are stored under
+    xcorr_lag<k> and are (runs x tappers), and metronome estimates are (runs,).
+    '''
+    # Put the windows on the last axis and drop the pacing clicks
+    asynchronies = np.moveaxis(np.asarray(asynchronies, dtype=float), 1, 2)[..., num_pacing_clicks:]
+    next_met_adjust = np.asarray(next_met_adjust, dtype=float)[:, num_pacing_clicks:]
+    adjust = next_met_adjust[:, np.newaxis, :]
+
+    estimates = {}
+
+    # Lag-1 autocorrelation of each tapper's asynchronies
+    _, _, estimates['lag1_autocorr'], _, _ = nan_regress(*shift_pair(asynchronies, asynchronies, 1))
+
+    # Cross-correlations of each tapper's asynchronies with the metronome adjustments
+    for lag in lags:
+        _, _, estimates[f'xcorr_lag{lag}'], _, _ = nan_regress(*shift_pair(asynchronies, np.broadcast_to(adjust, asynchronies.shape), lag))
+
+    # Linear phase correction. The slope of the change in asynchrony (corrected for the metronome adjustment) on the
+    # asynchrony is -alpha.
+    current, following = shift_pair(asynchronies, asynchronies, 1)
+    change = following - current + adjust[..., :-1]
+
+    slope, estimates['period_offset'], _, estimates['phase_correction_resid_std'], estimates['phase_correction_n'] = nan_regress(current, change)
+    estimates['phase_correction'] = -slope
+
+    # How strongly the metronome adjusts to the group mean asynchrony
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        group_asynchrony = np.nanmean(asynchronies, axis=1)
+
+    estimates['metronome_gain'], estimates['metronome_offset'], _, _, _ = nan_regress(group_asynchrony, next_met_adjust)
+
+    return estimates
+
+
+def analyze_reader(reader, runs=None, skip_invalid=True, num_pacing_clicks=0, lags=DEFAULT_XCORR_LAGS):
+    '''
+    Estimate the adaptive timing parameters for all (or the requested) runs of a GEMDataFileReader in one pass.
+    Returns a DataFrame with one row per run and tapper.
+    '''
+    if runs is None:
+        runs = range(0, reader.nruns)
+
+    if skip_invalid:
+        invalid_runs = reader.get_invalid_runs()
+        runs = [krun for krun in runs if reader.run_info[krun] not in invalid_runs]
+
+    runs, windows = reader.stack_windows(runs)
+
+    estimates = estimate_adaptive_timing(
+        reader.get_asynchrony_array(windows),
+        windows['next_met_adjust'],
+        num_pacing_clicks=num_pacing_clicks,
+        lags=lags,
+        )
+
+    tapper_ids = reader.get_valid_tapper_ids()
+    ntappers = len(tapper_ids)
+
+    run_hdrs = [reader.run_info[krun].hdr for krun in runs]
+
+    columns = {
+        'run': np.repeat(runs, ntappers),
+        'run_number': np.repeat([hdr.get('run_number') for hdr in run_hdrs], ntappers),
+        'metronome_alpha': np.repeat([hdr.get('metronome_alpha', hdr.get('alpha')) for hdr in run_hdrs], ntappers),
+        'tapper_id': np.tile(tapper_ids, len(runs)),
+    }
+
+    for name in TAPPER_ANALYSIS + [f'xcorr_lag{lag}' for lag in lags]:
+        columns[name] = estimates[name].ravel()
+
+    for name in RUN_ANALYSIS:
+        columns[name] = np.repeat(estimates[name], ntappers)
+
+    return pd.DataFrame(columns)
+
+
+# Analyze several files, e.g. all of the files in a study, labeling the rows with their file
+def analyze_readers(readers, labels=None, **kwargs):
+    if labels is None:
+        labels = [str(reader.filepath) for reader in readers]
+
+    frames = [analyze_reader(reader, **kwargs).assign(file=label) for reader, label in zip(readers, labels)]
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
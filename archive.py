@@ -0,0 +1,319 @@
+# archive.py
+#
+# Container that consolidates many GEM data files into a single file, so that an archive of small per-session files
+# can be read with one open and one large sequential read rather than thousands of opens.
+#
+# Layout:
+#   - magic (8 bytes), followed by the uint64 offset and uint64 length of the index
+#   - the window blocks of every run of every member file, each starting on an ARCHIVE_ALIGNMENT byte boundary and
+#     consisting of fixed-width, aligned window records (ARCHIVE_WINDOW_DTYPE)
+#   - the JSON index: for each member file its header, and for each run its header, the offset of its window block,
+#     and optionally the CRC32 of the block
+#
+# Members are read through GEMArchiveMemberReader, a GEMDataFileReader whose runs are GEMRun objects as usual.
+
+import os
+import json
+import mmap
+import zlib
+
+import numpy as np
+
+from .file import GEMDataFileReader, GEMRun, GEM_WINDOW_DTYPE
+from .corpus import resolve_paths, DEFAULT_FILE_PATTERN
+
+import pdb
+
+ARCHIVE_MAGIC = b'GEMARCV1'
+ARCHIVE_VERSION = 1
+
+# Window blocks start on cache line boundaries
+ARCHIVE_ALIGNMENT = 64
+
+# The GEM window record, with each field aligned to its size and the record padded to a multiple of 8 bytes
+ARCHIVE_WINDOW_DTYPE = np.dtype({
+    'names': list(GEM_WINDOW_DTYPE.names),
+    'formats': [GEM_WINDOW_DTYPE.fields[name][0] for name in GEM_WINDOW_DTYPE.names],
+    'offsets': [0, 2, 4, 8, 16],
+    'itemsize': 24,
+})
+
+PREAMBLE_SIZE = len(ARCHIVE_MAGIC) + 8 + 8
+
+
+def align(offset, alignment=ARCHIVE_ALIGNMENT):
+    return -(-offset//alignment)*alignment
+
+
+# Convert decoded GEM windows into archive records
+def to_archive_windows(windows):
+    records = np.zeros(len(windows), dtype=ARCHIVE_WINDOW_DTYPE)
+
+    for name in GEM_WINDOW_DTYPE.names:
+        records[name] = windows[name]
+
+    return records
+
+
+def write_member(fid, offset, name, path, checksums=True):
+    '''
+    Write the window blocks of the runs of the GEM data file at path to fid, starting at offset. Returns the member's
+    index entry and the offset following its last window block.
+    '''
+    reader = GEMDataFileReader(path, lazy=True)
+
+    member = {
+        'name': name,
+        'source': os.path.abspath(path),
+        'file_hdr': reader.file_hdr,
+        'nruns': reader.nruns,
+        'runs': [],
+    }
+
+    try:
+        for run in reader.run_info:
+            # Runs without data are kept in the index with a zero offset, as in GEM data files
+            if not run.hdr or run.windows is None:
+                member['runs'].append({'hdr': run.hdr, 'offset': 0, 'nwindows': 0, 'crc32': None})
+                continue
+
+            block = to_archive_windows(run.windows).tobytes()
+
+            start = align(offset)
+            fid.write(bytes(start-offset))
+            fid.write(block)
+            offset = start + len(block)
+
+            member['runs'].append({
+                'hdr': run.hdr,
+                'offset': start,
+                'nwindows': len(run.windows),
+                'crc32': zlib.crc32(block) if checksums else None,
+            })
+
+    finally:
+        reader.close()
+
+    return member, offset
+
+
+def repack_files(source, archive_path, pattern=DEFAULT_FILE_PATTERN, names=None, checksums=True):
+    '''
+    Write the GEM data files in source, which can be a directory, a glob pattern, or a list of paths, into a single
+    archive. Members are named by names if given, otherwise by file name. Files are read one run at a time, so memory
+    use doesn't grow with the size of the archive.
+
+    Files that can't be read are left out of the archive and listed, with their errors, under errors in the index.
+    The archive is written to a temporary file that replaces archive_path once it is complete.
+
+    Returns the archive index.
+    '''
+    paths = resolve_paths(source, pattern=pattern)
+
+    if names is None:
+        names = [os.path.basename(path) for path in paths]
+
+    if len(set(names)) != len(names):
+        raise ValueError('Archive member names must be unique')
+
+    index = {
+        'version': ARCHIVE_VERSION,
+        'alignment': ARCHIVE_ALIGNMENT,
+        'record_size': ARCHIVE_WINDOW_DTYPE.itemsize,
+        'checksums': checksums,
+        'files': [],
+        'errors': [],
+    }
+
+    tmp_path = f'{archive_path}.tmp-{os.getpid()}'
+
+    try:
+        with open(tmp_path, 'wb') as fid:
+            # The index location is filled in once everything else has been written
+            fid.write(ARCHIVE_MAGIC + bytes(PREAMBLE_SIZE-len(ARCHIVE_MAGIC)))
+            offset = PREAMBLE_SIZE
+
+            for name, path in zip(names, paths):
+                try:
+                    member, offset = write_member(fid, offset, name, path, checksums=checksums)
+
+                except Exception as err:
+                    # Discard whatever was written of the file before the error
+                    fid.seek(offset, 0)
+                    fid.truncate()
+
+                    index['errors'].append({'name': name, 'source': os.path.abspath(path), 'error': type(err).__name__, 'message': str(err)})
+                    continue
+
+                index['files'].append(member)
+
+            index_bytes = json.dumps(index).encode()
+            index_offset = align(offset)
+
+            fid.write(bytes(index_offset-offset))
+            fid.write(index_bytes)
+
+            fid.seek(len(ARCHIVE_MAGIC), 0)
+            fid.write(np.array([index_offset, len(index_bytes)], dtype='<u8').tobytes())
+
+        os.replace(tmp_path, archive_path)
+
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return index
+
+
+class GEMArchive:
+    '''
+    Reader of a GEM archive. With use_mmap, the archive is memory-mapped and decoded windows are views onto the mapping.
+    If verify_checksums is True, each run's window block is checked against its CRC32 when it is read.
+    '''
+    def __init__(self, path, use_mmap=True, verify_checksums=True):
+        self.path = path
+        self.use_mmap = use_mmap
+        self.verify_checksums = verify_checksums
+
+        self._io = open(path, 'rb')
+        self._mmap = mmap.mmap(self._io.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else None
+
+        preamble = self.read_bytes(0, PREAMBLE_SIZE)
+
+        if bytes(preamble[:len(ARCHIVE_MAGIC)]) != ARCHIVE_MAGIC:
+            raise ValueError(f'{path} is not a GEM archive')
+
+        self.index_offset, index_length = np.frombuffer(preamble, dtype='<u8', offset=len(ARCHIVE_MAGIC)).tolist()
+
+        self.index = json.loads(bytes(self.read_bytes(self.index_offset, index_length)))
+        self.members = {member['name']: member for member in self.index['files']}
+
+    def __repr__(self):
+        return f"GEMArchive({self.path!r}, {len(self.members)} files)"
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def names(self):
+        return list(self.members.keys())
+
+    def close(self):
+        # Arrays decoded from the mapping remain valid, so we only close the file
+        if self._io is not None:
+            self._io.close()
+            self._io = None
+
+    def read_bytes(self, offset, nbytes):
+        if self._mmap is not None:
+            return memoryview(self._mmap)[offset:offset+nbytes]
+
+        self._io.seek(offset, 0)
+
+        return self._io.read(nbytes)
+
+    def decode_run(self, buf, run):
+        if self.verify_checksums and run.get('crc32') is not None and zlib.crc32(buf) != run['crc32']:
+            raise ValueError(f"Checksum mismatch in window block at offset {run['offset']}")
+
+        return np.frombuffer(buf, dtype=ARCHIVE_WINDOW_DTYPE, count=run['nwindows'])
+
+    # Read the windows of a single run, given its index entry
+    def read_windows(self, run):
+        return self.decode_run(self.read_bytes(run['offset'], run['nwindows']*ARCHIVE_WINDOW_DTYPE.itemsize), run)
+
+    def get_reader(self, name, lazy=False):
+        return GEMArchiveMemberReader(self, name, lazy=lazy)
+
+    def iter_runs(self):
+        '''
+        Iterate over (member name, run index, run header, windows) for every run with data. All window blocks are
+        read in a single sequential read, or taken directly from the mapping if the archive is mapped.
+        '''
+        buf = self.read_bytes(PREAMBLE_SIZE, self.index_offset-PREAMBLE_SIZE)
+
+        for member in self.index['files']:
+            for krun, run in enumerate(member['runs']):
+                if not run['offset']:
+                    continue
+
+                start = run['offset']-PREAMBLE_SIZE
+                windows = self.decode_run(buf[start:start+run['nwindows']*ARCHIVE_WINDOW_DTYPE.itemsize], run)
+
+                yield member['name'], krun, run['hdr'], windows
+
+
+class GEMArchiveMemberReader(GEMDataFileReader):
+    '''
+    GEMDataFileReader over a member of a GEM archive. The file and run headers come from the archive index, and the
+    run offsets are the offsets of the runs' window blocks in the archive.
+    '''
+    def __init__(self, archive, name, lazy=False):
+        self.archive = archive
+        self.member = archive.members[name]
+
+        self.init_state(name, use_mmap=archive.use_mmap, lazy=lazy)
+
+        # The archive manages the underlying file
+        self.is_open = True
+
+        self.read_file_header()
+
+        if self.lazy:
+            return
+
+        self.read_file()
+
+        # Verify the data
+        clean, verifications = self.verify()
+        if not clean:
+            print(f"Found problems in {self.archive.path}:{self.filepath}")
+            print(verifications)
+
+    def open(self):
+        pass
+
+    def reopen(self):
+        pass
+
+    def close(self):
+        pass
+
+    def read_bytes(self, offset, nbytes):
+        return self.archive.read_bytes(offset, nbytes)
+
+    def read_file_header(self):
+        self.file_hdr = self.member['file_hdr']
+        self.nruns = self.member['nruns']
+        self.idx_map_offset = None
+
+        self.run_offsets = [run['offset'] for run in self.member['runs']]
+        self.run_info = [GEMRun(self, krun) for krun in range(0, self.nruns)]
+
+    def read_run_header(self, krun):
+        if self.run_offsets[krun]:
+            self.run_info[krun].hdr = self.member['runs'][krun]['hdr']
+
+        return self.run_info[krun].hdr
+
+    def read_run_windows(self, krun):
+        if self.run_offsets[krun]:
+            self.run_info[krun].windows = self.archive.read_windows(self.member['runs'][krun])
+
+        return self.run_info[krun].windows
+
+    # Archives are written once, so their runs never change
+    def refresh_run_offsets(self):
+        return []
+
+    def run_complete(self, krun, file_size=None):
+        return bool(self.run_offsets[krun])
@@ -0,0 +1,214 @@
+# benchmark.py
+#
+# Benchmarks of GEMDataFileReader and GEMRun on synthetic GEM data files of increasing size. Results can be appended
+# to a JSON-lines history file and compared against earlier results, so that performance regressions in the reader
+# are caught before they reach the analysis of real data.
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import datetime
+import tempfile
+import subprocess
+
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from .file import GEMDataFileReader
+from .synthetic import write_gem_file
+
+import pdb
+
+# File sizes to benchmark, as keyword arguments to write_gem_file. With the default five alphas, these contain 5, 50,
+# and 250 runs.
+BENCHMARK_SIZES = {
+    'small': {'repeats': 1, 'windows': 26, 'num_tappers': 1},
+    'medium': {'repeats': 10, 'windows': 26, 'num_tappers': 2},
+    'large': {'repeats': 50, 'windows': 26, 'num_tappers': 4},
+}
+
+# How much slower than the best previous median a benchmark may be before it is reported as a regression
+DEFAULT_REGRESSION_THRESHOLD = 1.25
+
+
+def open_reader(filepath):
+    return GEMDataFileReader(filepath, lazy=True)
+
+def open_mmap_reader(filepath):
+    return GEMDataFileReader(filepath, use_mmap=True, lazy=True)
+
+def open_read_reader(filepath):
+    reader = open_reader(filepath)
+    reader.read_file()
+
+    return reader
+
+
+def bench_read_file_header(reader):
+    open_reader(reader.filepath)
+
+def bench_read_file_header_mmap(reader):
+    open_mmap_reader(reader.filepath)
+
+def bench_read_file(reader):
+    # Opening a file eagerly reads and verifies all of its runs, and reports any problems
+    with redirect_stdout(io.StringIO()):
+        GEMDataFileReader(reader.filepath)
+
+def bench_read_run_data(reader):
+    for krun in range(0, reader.nruns):
+        reader.read_run_data(krun)
+
+def bench_verify_metronome_values(reader):
+    # The method reports each run that it verifies, which we don't want to time
+    with redirect_stdout(io.StringIO()):
+        for run in reader.run_info:
+            run.verify_metronome_values()
+
+def bench_compute_stats(reader):
+    with redirect_stdout(io.StringIO()):
+        for run in reader.run_info:
+            run.compute_stats(num_pacing_clicks=2)
+
+def bench_compute_stats_vectorized(reader):
+    reader.compute_stats(num_pacing_clicks=2)
+
+# Statistics of a single run of a lazily opened file, which should only read that run
+def bench_compute_run_stats(reader):
+    with redirect_stdout(io.StringIO()):
+        reader.run_info[-1].compute_stats(num_pacing_clicks=2)
+
+def bench_check_metronome(reader):
+    reader.check_metronome()
+
+def bench_false_start(reader):
+    for run in reader.run_info:
+        run.false_start()
+
+
+# Each benchmark is timed on a reader produced by its setup function, which is excluded from the timing
+BENCHMARKS = {
+    'read_file_header': (open_reader, bench_read_file_header),
+    'read_file_header_mmap': (open_reader, bench_read_file_header_mmap),
+    'read_file': (open_reader, bench_read_file),
+    'read_run_data': (open_reader, bench_read_run_data),
+    'read_run_data_mmap': (open_mmap_reader, bench_read_run_data),
+    'verify_metronome_values': (open_read_reader, bench_verify_metronome_values),
+    'check_metronome': (open_reader, bench_check_metronome),
+    'compute_stats': (open_read_reader, bench_compute_stats),
+    'compute_stats_vectorized': (open_reader, bench_compute_stats_vectorized),
+    'compute_run_stats_lazy': (open_reader, bench_compute_run_stats),
+    'false_start': (open_read_reader, bench_false_start),
+}
+
+
+def time_benchmark(setup, func, filepath, repeat):
+    timings = []
+
+    for _ in range(0, repeat):
+        reader = setup(filepath)
+
+        start = time.perf_counter()
+        func(reader)
+        timings.append((time.perf_counter()-start)*1000)
+
+        reader.close()
+
+    return timings
+
+
+# Get the commit of the working tree, if it is a git repository
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=None, benchmarks=None, repeat=5, seed=0):
+    '''
+    Time each of the benchmarks on a synthetic file of each size. Returns one result per size and benchmark,
+    with the per-run timings summarized in milliseconds.
+    '''
+    if sizes is None:
+        sizes = list(BENCHMARK_SIZES.keys())
+
+    if benchmarks is None:
+        benchmarks = list(BENCHMARKS.keys())
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            filepath = os.path.join(tmpdir, f'{size}.gdf')
+            write_gem_file(filepath, missing_rate=0.05, seed=seed, **BENCHMARK_SIZES[size])
+
+            nruns = open_reader(filepath).nruns
+
+            for name in benchmarks:
+                setup, func = BENCHMARKS[name]
+                timings = time_benchmark(setup, func, filepath, repeat)
+
+                results.append({
+                    'size': size,
+                    'benchmark': name,
+                    'nruns': nruns,
+                    'file_bytes': os.path.getsize(filepath),
+                    'repeat': repeat,
+                    'min_ms': min(timings),
+                    'median_ms': float(np.median(timings)),
+                    'max_ms': max(timings),
+                })
+
+    return results
+
+
+def append_history(results, history_path, label=None):
+    entry = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': get_commit(),
+        'label': label,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    with open(history_path, 'a') as fid:
+        fid.write(json.dumps(entry) + '\n')
+
+    return entry
+
+
+def read_history(history_path):
+    if not os.path.exists(history_path):
+        return []
+
+    with open(history_path, 'r') as fid:
+        return [json.loads(line) for line in fid if line.strip()]
+
+
+def find_regressions(results, history, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    '''
+    Compare results against the best median previously recorded for the same size and benchmark. Returns the results
+    that are more than threshold times slower, along with the baseline they were compared against.
+    '''
+    best = {}
+    for entry in history:
+        for result in entry['results']:
+            key = (result['size'], result['benchmark'])
+            best[key] = min(best.get(key, result['median_ms']), result['median_ms'])
+
+    regressions = []
+    for result in results:
+        baseline = best.get((result['size'], result['benchmark']))
+
+        if baseline is not None and result['median_ms'] > threshold*baseline:
+            regressions.append({**result, 'baseline_ms': baseline, 'ratio': result['median_ms']/baseline})
+
+    return regressions
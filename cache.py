@@ -0,0 +1,122 @@
+# cache.py
+#
+# Columnar (Parquet) cache of decoded GEM data files. The cache for a given source file is keyed by the file's
+# absolute path, and records the file's size and modification time, so a modified file never gets served stale data.
+# Rewriting the cache for a modified file replaces the previous contents.
+#
+# Only the decoded file is cached. Statistics depend on the parameters they are computed with, e.g.
+# num_pacing_clicks, so they are always recomputed.
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import pdb
+
+DEFAULT_CACHE_DIRNAME = '.gem_cache'
+
+
+def get_cache_key(filepath):
+    return hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()
+
+
+# The size and modification time of a source file, which must match those recorded in its cache
+def get_file_signature(filepath):
+    info = os.stat(filepath)
+
+    return {'size': info.st_size, 'mtime_ns': info.st_mtime_ns}
+
+
+# The cache lives in cache_dir if given, otherwise in a directory alongside the source file
+def get_cache_path(filepath, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), DEFAULT_CACHE_DIRNAME)
+
+    return os.path.join(cache_dir, get_cache_key(filepath))
+
+
+def write_cache(reader, cache_dir=None):
+    # Imported here to avoid a circular import
+    from .file import GEM_MAX_TAPPERS
+
+    cache_path = get_cache_path(reader.filepath, cache_dir)
+
+    # Write to a temporary directory that replaces any previous cache of the file once it is complete
+    tmp_path = f'{cache_path}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    # File header, run offsets, and run headers
+    header_info = {
+        'source': os.path.abspath(reader.filepath),
+        **get_file_signature(reader.filepath),
+        'file_hdr': reader.file_hdr,
+        'nruns': reader.nruns,
+        'run_offsets': reader.run_offsets,
+        'run_hdrs': [run.hdr for run in reader.run_info],
+    }
+
+    with open(os.path.join(tmp_path, 'header.json'), 'w') as fid:
+        json.dump(header_info, fid)
+
+    # Window data, one row per run and window
+    runs, windows = reader.stack_windows()
+    nwindows = windows.shape[1]
+
+    window_columns = {
+        'run': np.repeat(runs, nwindows),
+        'window': np.tile(np.arange(1, nwindows+1), len(runs)),
+        'dtp_id': windows['dtp_id'].ravel(),
+        'window_num': windows['window_num'].ravel(),
+        'met_time': windows['met_time'].ravel(),
+    }
+
+    for tapper in range(0, GEM_MAX_TAPPERS):
+        window_columns[f'asynchrony_{tapper}'] = windows['asynchronies'][..., tapper].ravel()
+
+    window_columns['next_met_adjust'] = windows['next_met_adjust'].ravel()
+
+    pd.DataFrame(window_columns).to_parquet(os.path.join(tmp_path, 'windows.parquet'), index=False)
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+
+    return cache_path
+
+
+# Read the cached contents for a source file. Returns None if there is no valid cache.
+def read_cache(filepath, cache_dir=None):
+    from .file import GEM_MAX_TAPPERS, GEM_WINDOW_DTYPE
+
+    cache_path = get_cache_path(filepath, cache_dir)
+
+    if not os.path.exists(os.path.join(cache_path, 'windows.parquet')):
+        return None
+
+    with open(os.path.join(cache_path, 'header.json'), 'r') as fid:
+        cached = json.load(fid)
+
+    # The source file has changed since the cache was written
+    if any(cached.get(key) != value for key, value in get_file_signature(filepath).items()):
+        return None
+
+    # Reassemble the per-run structured window arrays
+    df = pd.read_parquet(os.path.join(cache_path, 'windows.parquet')).sort_values(['run', 'window'])
+
+    nwindows = cached['file_hdr']['windows']
+    runs = df['run'].to_numpy()[::nwindows]
+
+    windows = np.zeros((len(runs), nwindows), dtype=GEM_WINDOW_DTYPE)
+    for field in ['dtp_id', 'window_num', 'met_time', 'next_met_adjust']:
+        windows[field] = df[field].to_numpy().reshape(len(runs), nwindows)
+
+    for tapper in range(0, GEM_MAX_TAPPERS):
+        windows['asynchronies'][..., tapper] = df[f'asynchrony_{tapper}'].to_numpy().reshape(len(runs), nwindows)
+
+    cached['windows'] = dict(zip(runs.tolist(), windows))
+
+    return cached
@@ -0,0 +1,272 @@
+# catalog.py
+#
+# SQLite index of the file and run headers in an archive of GEM data files. Building the catalog only reads each
+# file's header, run offset table, and run headers, so that runs can be found by condition without decoding any
+# window data. The catalog is updated incrementally, only re-reading files whose size or modification time changed.
+
+import os
+import json
+import sqlite3
+
+from .file import GEMDataFileReader, GEM_WINDOW_DTYPE, decode_windows
+from .corpus import resolve_paths, DEFAULT_FILE_PATTERN
+
+import pdb
+
+DEFAULT_CATALOG_NAME = 'gem_catalog.sqlite'
+
+CATALOG_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    nruns INTEGER,
+    nwindows INTEGER,
+    num_tappers INTEGER,
+    header TEXT
+);
+
+CREATE TABLE IF NOT EXISTS subjects (
+    file_id INTEGER NOT NULL REFERENCES files(file_id) ON DELETE CASCADE,
+    subject_id TEXT,
+    pad INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS runs (
+    file_id INTEGER NOT NULL REFERENCES files(file_id) ON DELETE CASCADE,
+    krun INTEGER NOT NULL,
+    run_offset INTEGER NOT NULL,
+    run_number INTEGER,
+    metronome_alpha REAL,
+    tempo REAL,
+    audio_feedback TEXT,
+    header TEXT,
+    PRIMARY KEY (file_id, krun)
+);
+
+CREATE INDEX IF NOT EXISTS runs_condition_idx ON runs (metronome_alpha, tempo);
+CREATE INDEX IF NOT EXISTS subjects_id_idx ON subjects (subject_id);
+'''
+
+# Header keys under which each condition may be recorded, in order of preference
+CONDITION_KEYS = {
+    'metronome_alpha': ['metronome_alpha', 'alpha'],
+    'tempo': ['tempo', 'metronome_tempo'],
+    'audio_feedback': ['audio_feedback'],
+}
+
+
+# Get the value of a condition for a run. Falls back on the file header if it has a single value for the condition.
+def get_condition(name, run_hdr, file_hdr):
+    for key in CONDITION_KEYS[name]:
+        if key in run_hdr:
+            value = run_hdr[key]
+            break
+    else:
+        value = None
+
+        for key in CONDITION_KEYS[name]:
+            file_value = file_hdr.get(key)
+
+            if isinstance(file_value, list) and len(file_value) == 1:
+                value = file_value[0]
+            elif file_value is not None and not isinstance(file_value, list):
+                value = file_value
+
+            if value is not None:
+                break
+
+    # Anything that isn't a scalar is stored as JSON
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value)
+
+    return value
+
+
+class RunHandle:
+    '''
+    Reference to a single run in a cataloged file. The run's windows are read directly from the file using the
+    cataloged offset, without parsing the file header or any other run.
+    '''
+    __slots__ = ['path', 'krun', 'run_offset', 'nwindows', 'hdr']
+
+    def __init__(self, path, krun, run_offset, nwindows, hdr):
+        self.path = path
+        self.krun = krun
+        self.run_offset = run_offset
+        self.nwindows = nwindows
+        self.hdr = hdr
+
+    def __repr__(self):
+        return f"RunHandle({self.path!r}, krun={self.krun})"
+
+    # Read and decode the run's windows
+    def load_windows(self):
+        with open(self.path, 'rb') as fid:
+            fid.seek(self.run_offset, 0)
+            hdr_len = int.from_bytes(fid.read(8), 'little')
+
+            fid.seek(hdr_len, 1)
+            buf = fid.read(self.nwindows*GEM_WINDOW_DTYPE.itemsize)
+
+        return decode_windows(buf, self.nwindows)
+
+    # Get the run as a GEMRun of a lazily opened reader, for use with the GEMRun methods
+    def load_run(self):
+        reader = GEMDataFileReader(self.path, lazy=True)
+
+        return reader.run_info[self.krun]
+
+
+class GEMCatalog:
+    def __init__(self, db_path=DEFAULT_CATALOG_NAME):
+        self.db_path = db_path
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.executescript(CATALOG_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def update(self, source, pattern=DEFAULT_FILE_PATTERN, prune=True):
+        '''
+        Add the files in source, which can be a directory, a glob pattern, or a list of paths, to the catalog.
+        Files that are already cataloged with the same size and modification time are skipped. If prune is True,
+        cataloged files that no longer exist are removed.
+
+        Returns the lists of added, updated, unchanged, and removed paths, along with (path, message) tuples for
+        files that couldn't be read.
+        '''
+        summary = {'added': [], 'updated': [], 'unchanged': [], 'removed': [], 'errors': []}
+
+        cataloged = {row['path']: row for row in self.conn.execute('SELECT file_id, path, size, mtime_ns FROM files')}
+
+        for path in resolve_paths(source, pattern=pattern):
+            path = os.path.abspath(path)
+            info = os.stat(path)
+
+            row = cataloged.get(path)
+            if row is not None and row['size'] == info.st_size and row['mtime_ns'] == info.st_mtime_ns:
+                summary['unchanged'].append(path)
+                continue
+
+            try:
+                self.index_file(path, info)
+
+            except Exception as err:
+                summary['errors'].append((path, f'{type(err).__name__}: {err}'))
+                continue
+
+            summary['updated' if row is not None else 'added'].append(path)
+
+        if prune:
+            removed = [path for path in cataloged if not os.path.exists(path)]
+
+            with self.conn:
+                self.conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+
+            summary['removed'] = removed
+
+        return summary
+
+    # (Re)catalog a single file, replacing any existing entries for it
+    def index_file(self, path, info=None):
+        if info is None:
+            info = os.stat(path)
+
+        # Only the file header and run offsets are read when the reader is created. Run headers are read on access.
+        reader = GEMDataFileReader(path, lazy=True)
+
+        try:
+            file_hdr = reader.file_hdr
+            run_hdrs = [run.hdr for run in reader.run_info]
+
+        finally:
+            reader.close()
+
+        with self.conn:
+            self.conn.execute('DELETE FROM files WHERE path = ?', (path,))
+
+            file_id = self.conn.execute(
+                'INSERT INTO files (path, size, mtime_ns, nruns, nwindows, num_tappers, header) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (path, info.st_size, info.st_mtime_ns, reader.nruns, file_hdr['windows'], len(file_hdr.get('subject_info', [])), json.dumps(file_hdr)),
+                ).lastrowid
+
+            self.conn.executemany(
+                'INSERT INTO subjects (file_id, subject_id, pad) VALUES (?, ?, ?)',
+                [(file_id, str(subject['id']), int(subject['pad'])) for subject in file_hdr.get('subject_info', [])],
+                )
+
+            # Runs that were never written have an offset of 0
+            self.conn.executemany(
+                'INSERT INTO runs (file_id, krun, run_offset, run_number, metronome_alpha, tempo, audio_feedback, header) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (
+                        file_id,
+                        krun,
+                        reader.run_offsets[krun],
+                        run_hdr.get('run_number'),
+                        get_condition('metronome_alpha', run_hdr, file_hdr),
+                        get_condition('tempo', run_hdr, file_hdr),
+                        get_condition('audio_feedback', run_hdr, file_hdr),
+                        json.dumps(run_hdr),
+                    )
+                    for krun, run_hdr in enumerate(run_hdrs)
+                ],
+                )
+
+        return file_id
+
+
+    def query(self, metronome_alpha=None, tempo=None, audio_feedback=None, num_tappers=None, subject_id=None, include_missing=False):
+        '''
+        Get handles to the cataloged runs that match the specified conditions. Each condition can be a single value
+        or a list of accepted values. Runs without data are only returned if include_missing is True.
+        '''
+        clauses = []
+        params = []
+
+        for column, value in [
+            ('runs.metronome_alpha', metronome_alpha),
+            ('runs.tempo', tempo),
+            ('runs.audio_feedback', audio_feedback),
+            ('files.num_tappers', num_tappers),
+            ]:
+            if value is None:
+                continue
+
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f"{column} IN ({','.join('?'*len(values))})")
+            params.extend(values)
+
+        if subject_id is not None:
+            values = subject_id if isinstance(subject_id, (list, tuple, set)) else [subject_id]
+            clauses.append(f"runs.file_id IN (SELECT file_id FROM subjects WHERE subject_id IN ({','.join('?'*len(values))}))")
+            params.extend([str(value) for value in values])
+
+        if not include_missing:
+            clauses.append('runs.run_offset > 0')
+
+        sql = 'SELECT files.path, files.nwindows, runs.krun, runs.run_offset, runs.header FROM runs JOIN files USING (file_id)'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY files.path, runs.krun'
+
+        return [
+            RunHandle(row['path'], row['krun'], row['run_offset'], row['nwindows'], json.loads(row['header']))
+            for row in self.conn.execute(sql, params)
+        ]
+
+    # Get the cataloged file headers, keyed by path
+    def get_file_headers(self):
+        return {row['path']: json.loads(row['header']) for row in self.conn.execute('SELECT path, header FROM files ORDER BY path')}
@@ -0,0 +1,22 @@
+# checks.py
+#
+# System checks for the configuration that gem_control relies on
+
+from django.core.checks import Warning, register
+
+from .context import cache_is_shared
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+
+    return [
+        Warning(
+            "gem_control keeps group session context in the default cache, which isn't shared between processes.",
+            hint="With more than one worker process, configure a shared cache backend such as Redis or Memcached. "
+                 "Otherwise context changes made by one process aren't seen by clients served by another.",
+            id='gem_control.W001',
+        )
+    ]
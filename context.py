@@ -0,0 +1,239 @@
+# context.py
+#
+# Cached, versioned store of group session context. Each change is written to Django's cache, along with a version
+# number, so that clients can wait on and read the cache rather than repeatedly reading the group session from the
+# database. Changes are written through to the GroupSession at durable checkpoints; transient states only live in the
+# cache until the next checkpoint or an explicit flush.
+#
+# Versions are derived from the wall clock and never decrease, even if the cache is flushed or restarted. The version
+# of the last durable checkpoint is stored in the context saved to the database, so that a cached copy older than the
+# database is never used in its place.
+#
+# The cache must be shared by all worker processes, e.g. Redis or Memcached. With a per-process cache such as the
+# default LocMemCache, transient states and context changes made by one process aren't seen by clients served by
+# another. The gem_control.W001 system check warns about this.
+
+from django.conf import settings
+from django.core.cache import cache
+
+from contextlib import contextmanager
+
+import polling2
+
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+
+import pdb
+
+# How long published contexts are retained
+CONTEXT_CACHE_TIMEOUT = 60*60*12
+
+# How long a client request waits for a new context, and how often the cache is checked while waiting
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_STEP = 0.1
+
+# How long the group session a client is attached to is remembered, so that waiting clients don't load it every time
+CLIENT_GROUP_CACHE_TIMEOUT = 60
+
+# How long a lock on a group session's context is held at most, and how long to wait to acquire it
+CONTEXT_LOCK_TIMEOUT = 5
+CONTEXT_LOCK_WAIT = 2*CONTEXT_LOCK_TIMEOUT
+
+# Key under which the version of the context is stored in the context saved to the database
+CONTEXT_VERSION_FIELD = 'context_version'
+
+# Cache backends that aren't shared between processes
+LOCAL_CACHE_BACKENDS = [
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+]
+
+# Number of submission fingerprints remembered per participant when submissions are tracked in the session
+MAX_SESSION_SUBMISSIONS = 100
+SUBMISSIONS_SESSION_KEY = 'gem_control_submissions'
+
+
+def get_context_key(session_id):
+    return f'gem_control:groupsession:{session_id}:context'
+
+def get_context_lock_key(session_id):
+    return f'gem_control:groupsession:{session_id}:context:lock'
+
+def get_submission_key(participant_session_id, fingerprint):
+    return f'gem_control:session:{participant_session_id}:submitted:{fingerprint}'
+
+def get_participant_group_key(participant_session_id):
+    return f'gem_control:session:{participant_session_id}:groupsession'
+
+def get_client_group_key(session_key):
+    return f'gem_control:client:{session_key}:groupsession'
+
+
+# Determine whether the default cache is shared by all worker processes
+def cache_is_shared():
+    backend = getattr(settings, 'CACHES', {}).get('default', {}).get('BACKEND', LOCAL_CACHE_BACKENDS[0])
+
+    return backend not in LOCAL_CACHE_BACKENDS
+
+
+# Hold a lock, implemented with the cache's atomic add, for the duration of the block. The lock expires after
+# timeout seconds in case its holder dies.
+@contextmanager
+def cache_lock(key, timeout=CONTEXT_LOCK_TIMEOUT, wait=CONTEXT_LOCK_WAIT):
+    token = uuid.uuid4().hex
+
+    polling2.poll(lambda: cache.add(key, token, timeout), step=0.01, timeout=wait)
+
+    try:
+        yield
+
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+# Get the version stored with a context, i.e. the version of the last durable checkpoint for a context from the database
+def get_context_version(context):
+    return (context or {}).get(CONTEXT_VERSION_FIELD, 0)
+
+# Versions are microseconds since the epoch, and always greater than the previously published version
+def get_next_version(published):
+    version = time.time_ns()//1000
+
+    if published is not None:
+        version = max(version, published['version']+1)
+
+    return version
+
+
+def save_context(session, durable=True, update_fields=['context']):
+    '''
+    Record a change to the group session's context by publishing it to the cache under a new version. If durable is
+    True, the group session is also saved, only writing the fields in update_fields (all fields if None), with the
+    version recorded in its context.
+
+    The version and the context are stored under a single key, and publishing is serialized by a lock, so a newer
+    context is never overwritten by an older one.
+    '''
+    with cache_lock(get_context_lock_key(session.pk)):
+        version = get_next_version(get_published_context(session.pk))
+
+        if durable:
+            session.context = {**(session.context or {}), CONTEXT_VERSION_FIELD: version}
+            session.save(update_fields=update_fields)
+
+        published = {
+            'version': version,
+            'state': session.state,
+            'context': session.context,
+        }
+
+        cache.set(get_context_key(session.pk), published, CONTEXT_CACHE_TIMEOUT)
+
+    return published
+
+# Publish the current context of a group session without saving it. This should be called whenever the context is changed.
+def publish_context(session):
+    return save_context(session, durable=False)
+
+# Publish the context of a group session only if no context has been published for it, e.g. after a cache flush. The
+# check is made under the publishing lock, so a context published meanwhile isn't overwritten by this possibly stale one.
+def publish_missing_context(session):
+    with cache_lock(get_context_lock_key(session.pk)):
+        if get_published_context(session.pk) is not None:
+            return None
+
+        published = {
+            'version': get_next_version(None),
+            'state': session.state,
+            'context': session.context,
+        }
+
+        cache.set(get_context_key(session.pk), published, CONTEXT_CACHE_TIMEOUT)
+
+    return published
+
+
+def get_published_context(session_id):
+    return cache.get(get_context_key(session_id))
+
+async def aget_published_context(session_id):
+    return await cache.aget(get_context_key(session_id))
+
+
+# Wait until a context other than version has been published. A context with a lower version than the client's
+# means that the versions have been reset, so it is returned as well. Returns None if nothing else is published
+# within the timeout. Waiting doesn't occupy a thread, so many clients can wait at once under ASGI.
+async def wait_for_context(session_id, version, timeout=LONG_POLL_TIMEOUT, step=LONG_POLL_STEP):
+    deadline = time.monotonic() + timeout
+
+    while True:
+        published = await aget_published_context(session_id)
+
+        if published is not None and published['version'] != version:
+            return published
+
+        if time.monotonic() >= deadline:
+            return None
+
+        await asyncio.sleep(step)
+
+
+# Get the current context of a group session. The cached copy is preferred over the one loaded from the database,
+# unless it is older than the last durable checkpoint, e.g. because it is a stale per-process copy.
+def get_current_context(session):
+    published = get_published_context(session.pk)
+
+    if published is None or published['version'] < get_context_version(session.context):
+        return session.context
+
+    return published['context']
+
+# Bring a group session's context up to date with the cached copy
+def sync_context(session):
+    session.context = get_current_context(session)
+
+    return session
+
+# Write the cached context through to the database if it is newer than the context saved there
+def flush_context(session):
+    published = get_published_context(session.pk)
+
+    if published is None:
+        return False
+
+    saved_context = type(session).objects.filter(pk=session.pk).values_list('context', flat=True).first()
+
+    if published['version'] <= get_context_version(saved_context):
+        return False
+
+    session.context = {**published['context'], CONTEXT_VERSION_FIELD: published['version']}
+    session.save(update_fields=['context'])
+
+    return True
+
+
+# A compact identifier of a trial, based on its number and parameters
+def get_trial_fingerprint(trial_num, params):
+    return hashlib.sha1(json.dumps({'trial_num': trial_num, 'params': params}, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+# Record that a participant has submitted a response for a trial. Returns False if they already have. Because cache.add
+# is atomic, only one of several near-simultaneous submissions, e.g. from a double-click, is accepted. If the cache
+# isn't shared between processes, submissions are tracked in the participant's (database-backed) session instead.
+def mark_submission(participant_session_id, fingerprint, session_store=None):
+    if cache_is_shared() or session_store is None:
+        return cache.add(get_submission_key(participant_session_id, fingerprint), True, CONTEXT_CACHE_TIMEOUT)
+
+    submissions = session_store.get(SUBMISSIONS_SESSION_KEY, [])
+
+    if fingerprint in submissions:
+        return False
+
+    session_store[SUBMISSIONS_SESSION_KEY] = (submissions + [fingerprint])[-MAX_SESSION_SUBMISSIONS:]
+    # Save right away rather than with the response, so that a second submission sees this one
+    session_store.save()
+
+    return True
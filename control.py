@@ -3,20 +3,31 @@
 # Methods for setting state during Groove Enhancement Machine (GEM) experiments
 
 import json
+import time
+import asyncio
+
+from asgiref.sync import sync_to_async
 
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.decorators import login_required
 
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseGone
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseGone, HttpResponseNotFound, HttpResponseNotAllowed, JsonResponse
 from django.shortcuts import render
 
-import polling2
-
-from pyensemble.models import Session, Response
-from pyensemble.group.models import GroupSession, GroupSessionSubjectSession
 from pyensemble.group import views as group_views
 
 from .forms import ExperimentInitForm, TrialInitForm
+from .schedule import generate_schedule, get_num_trials, get_trial_params, get_upcoming_trials
+from .context import (
+    publish_context, publish_missing_context, get_published_context, aget_published_context, wait_for_context, sync_context, save_context, flush_context,
+    get_participant_group_key, get_client_group_key, get_trial_fingerprint, mark_submission, cache_is_shared,
+    LONG_POLL_TIMEOUT, CONTEXT_CACHE_TIMEOUT, CLIENT_GROUP_CACHE_TIMEOUT,
+    )
+from .metrics import instrument, timed, metrics
+from .journal import record_event, Events
+from .file import GEM_MAX_TAPPERS
+from . import live
 
 
 import logging
@@ -32,6 +43,7 @@ Setting things up this way also sets the stage for allowing the client to set th
 and helps keep the control mechanisms abstract.
 '''
 
+@instrument
 @login_required
 def init_experiment(request):
     if request.method == 'POST':
@@ -59,14 +71,18 @@ def init_experiment(request):
             # Write current experiment context to the group session context (this is what the participant sessions poll to obtain state)
             session.context = context
 
-            # Write our parameters to the session parameters
-            session.params = params
+            # Write our parameters to the session parameters, along with the trial schedule if one can be generated
+            schedule = generate_schedule(params)
+
+            session.params = {**params, 'schedule': schedule} if schedule else params
 
             # Write our initalized state to the group session object
             session.state = session.States.RUNNING
 
-            # Save the group session object
-            session.save()
+            # Save the group session object and notify any waiting participant clients
+            save_context(session, update_fields=None)
+
+            record_event(session.pk, Events.EXPERIMENT_INIT, trial_num=0)
 
             # Return success
             return HttpResponse(status=202)
@@ -79,17 +95,195 @@ def init_experiment(request):
         'form': form
     }
 
-    return render(request, template, context)
+    # An invalid submission is a bad request, so that the GEM GUI doesn't mistake the re-rendered form for success
+    status = 400 if form.is_bound else 200
+
+    return render(request, template, context, status=status)
 
+@instrument
 def end_experiment(request):
+    session = get_group_session(request)
+
+    # Make sure the database has the latest context
+    if session:
+        flush_context(session)
+
     response = group_views.end_groupsession(request)
 
     return HttpResponse(response)
 
+# How long to wait for all participants to be ready for the next trial
+GROUP_READY_TIMEOUT = 60*5
+
+# When waiting asynchronously, how long each readiness check may block the thread that runs synchronous code, and how
+# long to sleep between checks
+GROUP_READY_PROBE_TIMEOUT = 0.1
+GROUP_READY_STEP = 0.5
+
+# Get the group session object, with its context brought up to date from the context cache
+def get_group_session(request):
+    session = group_views.get_group_session(request)
+
+    if session:
+        sync_context(session)
+
+    return session
+
+# Fill in the trial number and parameters from the trial schedule, if the client didn't provide them. Returns an error
+# response if the trial lies beyond the end of the schedule, or if there is no schedule to take missing parameters from.
+def apply_schedule(session, current_params):
+    if current_params.get('trial_num') is None:
+        current_params['trial_num'] = session.context['trial_num']+1
+
+    schedule = (session.params or {}).get('schedule')
+
+    error = None
+
+    if schedule and current_params['trial_num'] > get_num_trials(schedule):
+        error = {
+            'error': 'ScheduleExhausted',
+            'num_trials': get_num_trials(schedule),
+            'requested_trialnum': current_params['trial_num'],
+        }
+
+    elif current_params.get('params') is None:
+        if not schedule:
+            error = {
+                'error': 'MissingTrialParams',
+                'requested_trialnum': current_params['trial_num'],
+            }
+        else:
+            current_params['params'] = get_trial_params(schedule, current_params['trial_num'])
+
+    if error:
+        logger.warning(json.dumps(error, indent=2))
+
+        return HttpResponseBadRequest(json.dumps(error))
+
+    return None
+
+# Perform some validation based on designated trial number and cached info. Returns an error response if the trial numbers don't match.
+def check_trial_num(session, current_params):
+    cached_trialnum = session.context['trial_num']
+
+    if current_params['trial_num'] != cached_trialnum+1:
+        # Return error information to the client
+        context = {
+            'error': 'TrialNumberMismatch',
+            'cached_trialnum': cached_trialnum,
+            'requested_trialnum': current_params['trial_num']
+        }
+
+        session.context['trial_num'] = cached_trialnum - 1
+        save_context(session)
+
+        # Log the error
+        logger.warning(json.dumps(context, indent=2))
+
+        return HttpResponseBadRequest(json.dumps(context))
+
+    return None
+
+# This is a transient state, so it is only written to the context cache
+def set_trial_initializing(session):
+    session.context.update({'state':'trial:initializing'})
+    save_context(session, durable=False)
+
+def set_trial_initialized(session, current_params, durable=True):
+    current_params.update({
+        'state':'trial:initialized',
+        'fingerprint': get_trial_fingerprint(current_params['trial_num'], current_params.get('params')),
+        })
+    session.context = current_params
+    save_context(session, durable=durable)
+
+# Set the trial state on a group session that has already been loaded, as PyEnsemble's start_trial and end_trial do
+def set_trial_state(session, state, durable=True):
+    session.context.update({'state': state})
+    save_context(session, durable=durable)
+
+@instrument
 @login_required
 def init_trial(request):
     # Get the group session object
-    session = group_views.get_group_session(request)
+    session = get_group_session(request)
+
+    if request.method == 'POST':
+        form = TrialInitForm(request.POST)
+
+        with timed('validation_ms', 'init_trial'):
+            form_valid = form.is_valid()
+
+        if form_valid:
+            current_params = form.cleaned_data
+
+            error_response = apply_schedule(session, current_params)
+
+            if error_response:
+                return error_response
+
+            record_event(session.pk, Events.TRIAL_INIT_REQUESTED, trial_num=current_params['trial_num'])
+
+            with timed('trial_num_check_ms', 'init_trial'):
+                error_response = check_trial_num(session, current_params)
+
+            if error_response:
+                return error_response
+
+            # Wait until all participants are ready again on their clients
+            with timed('group_ready_wait_ms', 'init_trial'):
+                group_ready = session.wait_group_ready_client(timeout=GROUP_READY_TIMEOUT)
+
+            if not group_ready:
+                return HttpResponseGone()
+
+            record_event(session.pk, Events.GROUP_READY, trial_num=current_params['trial_num'])
+
+            # Set group session context
+            set_trial_initialized(session, current_params)
+
+            return HttpResponse(status=202)
+
+    else:
+        form = TrialInitForm()
+
+        # Set group session context
+        set_trial_initializing(session)
+
+    template = 'gem_control/init_trial.html'
+    context = {
+        'form': form
+    }
+
+    return render(request, template, context)
+
+# Wait for the group to be ready without holding on to a thread. Each check queries the database, so it runs on the
+# thread that Django uses for synchronous code, whose database connections are cleaned up at the end of the request,
+# and blocks it for at most GROUP_READY_PROBE_TIMEOUT.
+async def async_wait_group_ready_client(session, timeout=GROUP_READY_TIMEOUT):
+    deadline = time.monotonic() + timeout
+
+    while True:
+        group_ready = await sync_to_async(session.wait_group_ready_client, thread_sensitive=True)(timeout=GROUP_READY_PROBE_TIMEOUT)
+
+        if group_ready:
+            return True
+
+        if time.monotonic() >= deadline:
+            return False
+
+        await asyncio.sleep(GROUP_READY_STEP)
+
+'''
+An asynchronous version of init_trial for use under ASGI. While waiting for the group to become ready, the request 
+doesn't occupy a worker thread. Trial number validation and the timeout response are the same as for init_trial, 
+and waiting clients of get_context are notified as soon as the trial is initialized.
+'''
+@instrument
+@login_required
+async def init_trial_async(request):
+    # Get the group session object
+    session = await sync_to_async(get_group_session)(request)
 
     if request.method == 'POST':
         form = TrialInitForm(request.POST)
@@ -97,35 +291,29 @@ def init_trial(request):
         if form.is_valid():
             current_params = form.cleaned_data
 
-            # Perform some validation based on designated trial number and cached info
-            cached_trialnum = session.context['trial_num']
+            error_response = apply_schedule(session, current_params)
 
-            if current_params['trial_num'] != cached_trialnum+1:
-                # Return error information to the client
-                context = {
-                    'error': 'TrialNumberMismatch',
-                    'cached_trialnum': cached_trialnum,
-                    'requested_trialnum': current_params['trial_num']
-                }
+            if error_response:
+                return error_response
 
-                session.context['trial_num'] = cached_trialnum - 1
-                session.save()
+            await sync_to_async(record_event)(session.pk, Events.TRIAL_INIT_REQUESTED, trial_num=current_params['trial_num'])
 
-                # Log the error
-                logger.warning(json.dumps(context, indent=2))
+            error_response = await sync_to_async(check_trial_num)(session, current_params)
 
-                return HttpResponseBadRequest(json.dumps(context))
+            if error_response:
+                return error_response
 
             # Wait until all participants are ready again on their clients
-            group_ready = session.wait_group_ready_client(timeout=60*5)
+            with timed('group_ready_wait_ms', 'init_trial_async'):
+                group_ready = await async_wait_group_ready_client(session, timeout=GROUP_READY_TIMEOUT)
 
             if not group_ready:
                 return HttpResponseGone()
 
+            await sync_to_async(record_event)(session.pk, Events.GROUP_READY, trial_num=current_params['trial_num'])
+
             # Set group session context
-            current_params.update({'state':'trial:initialized'})
-            session.context = current_params
-            session.save()
+            await sync_to_async(set_trial_initialized)(session, current_params)
 
             return HttpResponse(status=202)
 
@@ -133,8 +321,7 @@ def init_trial(request):
         form = TrialInitForm()
 
         # Set group session context
-        session.context.update({'state':'trial:initializing'})
-        session.save()
+        await sync_to_async(set_trial_initializing)(session)
 
     template = 'gem_control/init_trial.html'
     context = {
@@ -143,64 +330,303 @@ def init_trial(request):
 
     return render(request, template, context)
 
+'''
+A view by which clients can prefetch the parameters of upcoming trials from the trial schedule generated at 
+experiment initialization. By default, the next trial is returned. The trial_num and count query parameters 
+can be used to request a different range of trials.
+'''
+@instrument
+@login_required
+def get_schedule(request):
+    session = get_group_session(request)
+
+    schedule = (session.params or {}).get('schedule')
+
+    if not schedule:
+        return HttpResponseNotFound()
+
+    try:
+        trial_num = int(request.GET.get('trial_num', session.context['trial_num']+1))
+        count = int(request.GET.get('count', 1))
+
+    except ValueError as err:
+        return HttpResponseBadRequest(json.dumps({'error': 'ValueError', 'message': str(err)}))
+
+    return JsonResponse({
+        'num_trials': get_num_trials(schedule),
+        'trials': get_upcoming_trials(schedule, trial_num, count),
+    })
+
+# Report the outcome of advance_trial, including the phase in which it stopped
+def advance_trial_response(phase, status, **kwargs):
+    return JsonResponse({'phase': phase, 'status': status, **kwargs}, status=status)
+
+'''
+A view that performs the transition between consecutive trials as a single request: ending the current trial, 
+initializing the next trial (including the trial number check and waiting for the group to be ready), and starting
+it. The POST data are the same as for init_trial. If a phase fails, the response indicates which phase failed and
+carries that phase's status code.
+
+The group session is loaded once, and all transitions are applied to that object. The intermediate states are only
+published, and the group session is saved once, when the trial has started.
+'''
+@instrument
+@login_required
+def advance_trial(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    form = TrialInitForm(request.POST)
+
+    if not form.is_valid():
+        return advance_trial_response('validate', 400, errors=form.errors.get_json_data())
+
+    # Get the group session object
+    session = get_group_session(request)
+
+    # End the current trial, if there is one
+    if session.context['trial_num'] > 0:
+        set_trial_state(session, 'trial:ended', durable=False)
+
+        record_event(session.pk, Events.TRIAL_END, trial_num=session.context['trial_num'])
+
+    # Initialize the next trial
+    current_params = form.cleaned_data
+
+    error_response = apply_schedule(session, current_params)
+
+    if error_response:
+        return advance_trial_response('init_trial', error_response.status_code, **json.loads(error_response.content))
+
+    record_event(session.pk, Events.TRIAL_INIT_REQUESTED, trial_num=current_params['trial_num'])
+
+    error_response = check_trial_num(session, current_params)
+
+    if error_response:
+        return advance_trial_response('init_trial', error_response.status_code, **json.loads(error_response.content))
+
+    with timed('group_ready_wait_ms', 'advance_trial'):
+        group_ready = session.wait_group_ready_client(timeout=GROUP_READY_TIMEOUT)
+
+    if not group_ready:
+        return advance_trial_response('init_trial', HttpResponseGone.status_code)
+
+    record_event(session.pk, Events.GROUP_READY, trial_num=current_params['trial_num'])
+
+    set_trial_initialized(session, current_params, durable=False)
+
+    # Start the trial, saving the group session and letting waiting participant clients know
+    set_trial_state(session, 'trial:started')
+
+    record_event(session.pk, Events.TRIAL_START, trial_num=current_params['trial_num'])
+
+    return advance_trial_response('complete', 202, trial_num=current_params['trial_num'])
+
 # We aren't performing any special handling during either the starting or stopping of a trial, so just pass the requests along
+# and let any waiting participant clients know about the change in state
+@instrument
 @login_required
 def start_trial(request):
     response = group_views.start_trial(request)
 
+    session = get_group_session(request)
+    publish_context(session)
+    record_event(session.pk, Events.TRIAL_START, trial_num=session.context.get('trial_num'))
+
     return response
 
+@instrument
 @login_required
 def end_trial(request):
     response = group_views.end_trial(request)
 
+    session = get_group_session(request)
+    publish_context(session)
+    record_event(session.pk, Events.TRIAL_END, trial_num=session.context.get('trial_num'))
+
     return response
 
 
+@instrument
 def exit_loop(request):
-    group_views.get_group_session(request).set_group_exit_loop()
+    session = get_group_session(request)
+    session.set_group_exit_loop()
+
+    publish_context(session)
+    record_event(session.pk, Events.LOOP_EXIT, trial_num=session.context.get('trial_num'))
 
     return HttpResponse(status=200)
 
-def record_response(request, *args, **kwargs):
-    okay = True
+# Get the ID of the group session a client is attached to, or False if it isn't attached to one. The ID is
+# remembered for the client's Django session, so that the group session is only loaded once in a while.
+def get_client_group_session_id(request):
+    session = get_group_session(request)
+    session_id = session.pk if session else False
+
+    cache.set(get_client_group_key(request.session.session_key), session_id, CLIENT_GROUP_CACHE_TIMEOUT)
+
+    # Make sure there is a context to wait on, e.g. after the cache was cleared
+    if session:
+        publish_missing_context(session)
+
+    return session_id
+
+'''
+A long-poll view by which participant clients learn about changes to the group session context. The client passes
+the version of the context it last received, and the request returns as soon as a different version has been
+published. A published version lower than the client's, e.g. after the cache was cleared, is returned right away.
+If nothing changes within the poll timeout, a 204 is returned and the client should simply poll again.
+
+The view is asynchronous, so under ASGI a waiting client doesn't occupy a worker thread. Waiting only reads the
+cache; the group session is only loaded from the database when the client's group session ID isn't cached, or
+when there is no published context to wait on.
+'''
+@instrument
+@login_required
+async def get_context(request):
+    try:
+        version = int(request.GET.get('version', 0))
+
+    except ValueError as err:
+        return HttpResponseBadRequest(json.dumps({'error': 'ValueError', 'message': str(err)}))
+
+    session_id = await cache.aget(get_client_group_key(request.session.session_key))
+
+    if session_id is None or (session_id and await aget_published_context(session_id) is None):
+        session_id = await sync_to_async(get_client_group_session_id)(request)
+
+    if not session_id:
+        return HttpResponseNotFound()
+
+    published = await wait_for_context(session_id, version, timeout=LONG_POLL_TIMEOUT)
+
+    if published is None:
+        return HttpResponse(status=204)
+
+    return JsonResponse(published)
+
+# Report the aggregated view metrics
+@login_required
+def get_metrics(request):
+    return JsonResponse(metrics.snapshot())
+
+'''
+A view by which the GEM GUI streams window data while a trial is running. The POST body is a JSON object containing
+a list of windows, each with met_time, asynchronies (one per pad), and next_met_adjust. The first batch of a trial
+may also specify tapper_idxs, tapper_ids, and num_pacing_clicks. The trial defaults to the current trial.
+'''
+@instrument
+@login_required
+def ingest_windows(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        packet = json.loads(request.body)
+
+        if not isinstance(packet, dict):
+            raise TypeError('The request body must be a JSON object')
+
+        windows = packet['windows']
+
+        trial_num = packet.get('trial_num')
+        if trial_num is not None and (not isinstance(trial_num, int) or isinstance(trial_num, bool) or trial_num < 1):
+            raise ValueError('trial_num must be a positive integer')
+
+    except (ValueError, KeyError, TypeError) as err:
+        return HttpResponseBadRequest(json.dumps({'error': type(err).__name__, 'message': str(err)}))
+
+    session = get_group_session(request)
+
+    if trial_num is None:
+        trial_num = session.context['trial_num']
 
-    # Get the user's session
-    session = Session.objects.get(pk=kwargs['session_id'])
+    tapper_idxs = packet.get('tapper_idxs')
+    if tapper_idxs is None:
+        tapper_idxs = range(0, (session.params or {}).get('tappers_requested', GEM_MAX_TAPPERS))
 
-    # Get the experiment session info cache key
-    expsess_key = session.experiment.cache_key
+    try:
+        live_stats = live.ingest_windows(
+            session.pk,
+            trial_num,
+            windows,
+            tapper_idxs=tapper_idxs,
+            tapper_ids=packet.get('tapper_ids'),
+            num_pacing_clicks=packet.get('num_pacing_clicks', 0),
+            )
 
-    # Retrieve expsessinfo from cache
-    expsessinfo = request.session[expsess_key]
+    except (ValueError, TypeError) as err:
+        return HttpResponseBadRequest(json.dumps({'error': type(err).__name__, 'message': str(err)}))
 
-    # Get our last response
-    previous_trial_info = expsessinfo.get('previous_trial_info', None)
+    if live_stats is None:
+        return HttpResponse(status=409)
+
+    return JsonResponse({'trial_num': trial_num, 'num_windows': live_stats.num_windows}, status=202)
+
+# Report the current live statistics of a trial, by default the current one
+@instrument
+@login_required
+def get_live_stats(request):
+    session = get_group_session(request)
+
+    try:
+        trial_num = int(request.GET.get('trial_num', session.context['trial_num']))
+
+    except ValueError as err:
+        return HttpResponseBadRequest(json.dumps({'error': 'ValueError', 'message': str(err)}))
+
+    live_stats = live.get_live_stats(session.pk, trial_num)
+
+    if live_stats is None:
+        return HttpResponseNotFound()
+
+    return JsonResponse({'trial_num': trial_num, **live.nan_to_none(live_stats.get_stats())})
+
+# Get the ID and current context of the participant's group session, or (None, None) if they aren't in a group session
+def get_participant_group_context(request, participant_session_id):
+    # The group session a participant belongs to doesn't change, so we only need to look it up once
+    group_key = get_participant_group_key(participant_session_id)
+    group_session_id = cache.get(group_key)
+
+    # A per-process cache may hold a stale context, in which case the group session is read from the database
+    published = get_published_context(group_session_id) if group_session_id and cache_is_shared() else None
+
+    if published is not None:
+        return group_session_id, published['context']
+
+    group_session = get_group_session(request)
+
+    cache.set(group_key, group_session.pk if group_session else False, CONTEXT_CACHE_TIMEOUT)
+
+    if not group_session:
+        return None, None
+
+    return group_session.pk, group_session.context
+
+@instrument
+def record_response(request, *args, **kwargs):
+    okay = True
 
     '''
         Because we aren't transmitting trial information via the page that the
         participant submits, we can only check in the context of a group session
-        and the parameters set for that group session.
+        and the trial that is currently set for that group session. The trial
+        won't change until everyone signals that they are ready for the next
+        trial after their current forms are submitted and they've been served a
+        new form.
     '''
-    group_session = group_views.get_group_session(request)
-
-    if group_session:
-        '''
-            Get the currently set trial parameters. These won't change until everyone 
-            signals that they are ready for the next trial after their current forms 
-            are submitted and they've been served a new form.
-        '''
-        current_trial_info = group_session.context.get('params',{})
-
-        # If the current parameters match those that have already been cached, we are trying to resubmit the form, so we should fail
-        if previous_trial_info == current_trial_info:
+    group_session_id, context = get_participant_group_context(request, kwargs['session_id'])
+
+    if context is not None:
+        fingerprint = context.get('fingerprint') or get_trial_fingerprint(context.get('trial_num'), context.get('params', {}))
+
+        # If this participant has already submitted a response for this trial, we are trying to resubmit the form, so we should fail
+        if not mark_submission(kwargs['session_id'], fingerprint, session_store=request.session):
             okay = False
             if settings.DEBUG:
                 print('Repeated submission ...')
 
         else:
-            # Update the previous trial info with the current trial info
-            expsessinfo['previous_trial_info'] = current_trial_info
-            request.session.modified = True
+            record_event(group_session_id, Events.RESPONSE_RECORDED, trial_num=context.get('trial_num'), session_id=kwargs['session_id'])
 
     return okay
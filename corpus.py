@@ -0,0 +1,164 @@
+# corpus.py
+#
+# Methods for loading and summarizing many GEM data files at once
+
+import os
+import glob
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .file import GEMDataFileReader
+
+import pdb
+
+DEFAULT_FILE_PATTERN = '*.gdf'
+
+
+class GEMCorpus:
+    '''
+    Combined results from loading a set of GEM data files.
+
+    windows: one row per file, run, window, and tapper
+    tapper_stats: one row per file, run, and tapper
+    run_stats: one row per file and run, containing the metronome and group statistics
+    errors: one row per file that could not be loaded
+    '''
+    def __init__(self, windows, tapper_stats, run_stats, errors):
+        self.windows = windows
+        self.tapper_stats = tapper_stats
+        self.run_stats = run_stats
+        self.errors = errors
+
+    def __repr__(self):
+        return f"GEMCorpus({self.run_stats['file'].nunique() if not self.run_stats.empty else 0} files, {len(self.run_stats)} runs, {len(self.errors)} errors)"
+
+
+# Expand a directory, glob pattern, or list of paths into a list of paths
+def resolve_paths(source, pattern=DEFAULT_FILE_PATTERN):
+    if isinstance(source, (list, tuple)):
+        return list(source)
+
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, pattern)))
+
+    return sorted(glob.glob(source))
+
+
+def load_corpus(source, processes=None, pattern=DEFAULT_FILE_PATTERN, use_storage=False, **kwargs):
+    '''
+    Load, verify, and compute statistics for every file in source, which can be a directory, a glob pattern,
+    or a list of paths. If use_storage is True, the paths are names in Django's default storage (e.g. S3).
+
+    Files are processed in a pool of processes. Setting processes to 0 processes the files serially in the
+    current process. Any remaining keyword arguments, e.g. num_pacing_clicks, are passed to compute_stats.
+    '''
+    paths = resolve_paths(source, pattern=pattern)
+
+    if processes == 0:
+        results = [load_file_tables(path, use_storage, kwargs) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(load_file_tables, paths, [use_storage]*len(paths), [kwargs]*len(paths)))
+
+    # Combine the per-file tables
+    tables = {}
+    for key in ['windows', 'tapper_stats', 'run_stats', 'errors']:
+        frames = [result[key] for result in results if key in result]
+        tables[key] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    return GEMCorpus(**tables)
+
+
+# Get something GEMDataFileReader can read for a name in Django's default storage: a local path if the storage is on
+# the local filesystem, otherwise the storage's file object (e.g. an S3File)
+def get_storage_file(path):
+    from django.core.files.storage import default_storage
+
+    try:
+        return default_storage.path(path)
+
+    except NotImplementedError:
+        return default_storage.open(path, 'rb')
+
+
+# Load a single file and return its tidy tables. Errors are caught and returned so that they don't abort the batch.
+def load_file_tables(path, use_storage=False, stats_kwargs=None):
+    try:
+        if use_storage:
+            filepath = get_storage_file(path)
+        else:
+            filepath = path
+
+        reader = GEMDataFileReader(filepath, lazy=True)
+
+        return get_file_tables(reader, str(path), **(stats_kwargs or {}))
+
+    except Exception as err:
+        return {
+            'errors': pd.DataFrame([{
+                'file': str(path),
+                'error': type(err).__name__,
+                'message': str(err),
+                'traceback': traceback.format_exc(),
+            }])
+        }
+
+
+def get_file_tables(reader, file_label, **kwargs):
+    # Make sure all of the data are checked
+    reader.verify()
+
+    tapper_ids = reader.get_valid_tapper_ids()
+
+    invalid_runs = reader.get_invalid_runs()
+
+    # Compute the statistics for all of the valid runs at once
+    reader.compute_stats(**kwargs)
+
+    windows = []
+    tapper_stats = []
+    run_stats = []
+
+    for run in reader.run_info:
+        # Skip runs for which we have no data
+        if not run.hdr or run.windows is None:
+            continue
+
+        run_number = run.hdr['run_number']
+        valid = run not in invalid_runs
+
+        # Per-window data, one row per tapper
+        nwindows = len(run.windows)
+        asynchronies = reader.get_asynchrony_array(run.windows)
+
+        windows.append(pd.DataFrame({
+            'file': file_label,
+            'run_number': run_number,
+            'window': np.repeat(np.arange(1, nwindows+1), len(tapper_ids)),
+            'window_num': np.repeat(run.windows['window_num'], len(tapper_ids)),
+            'met_time': np.repeat(run.windows['met_time'], len(tapper_ids)),
+            'next_met_adjust': np.repeat(run.windows['next_met_adjust'], len(tapper_ids)),
+            'tapper_id': np.tile(tapper_ids, nwindows),
+            'asynchrony': asynchronies.ravel(),
+        }))
+
+        if not valid:
+            run_stats.append({'file': file_label, 'run_number': run_number, 'valid': False})
+            continue
+
+        for tapper_id, stats in run.tapper_stats.items():
+            tapper_stats.append({'file': file_label, 'run_number': run_number, 'tapper_id': tapper_id, **stats})
+
+        run_stats.append({'file': file_label, 'run_number': run_number, 'valid': True, **run.metronome_stats, **run.group_stats})
+
+    reader.close()
+
+    return {
+        'windows': pd.concat(windows, ignore_index=True) if windows else pd.DataFrame(),
+        'tapper_stats': pd.DataFrame(tapper_stats),
+        'run_stats': pd.DataFrame(run_stats),
+    }
@@ -4,99 +4,184 @@
 
 from pyensemble.models import DataFormat, Question, Form, FormXQuestion, ExperimentXForm, Experiment
 
-from django.http import HttpResponse
+from django.db import models, transaction
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseBadRequest
 
-def create_test_experiment(request):
-    # Instantiates necessary response options, questions, forms, and experiment to test running a GEM group experiment.
+from .metrics import instrument
 
-    # Create the experiment object
-    eo, created = Experiment.objects.get_or_create(title='GEM Test', is_group=True)
 
-    # Define some data formats as a list of dictionaries
-    data_formats = [
-        {
-            'df_type': 'enum',
-            'enum_values': '"Yes","No"',
+# Build the specification of a GEM experiment with a single post-trial form that is repeated across trials
+def get_gem_experiment_spec(title='GEM Test', repeats=10, is_group=True):
+    return {
+        'experiment': {
+            'title': title,
+            'is_group': is_group,
         },
-        {
-            'df_type': 'enum',
-            'enum_values': '"Strongly Disagree","Somewhat Disagree","Neither Agree nor Disagree","Somewhat Agree","Strongly Agree"',
-        },
-        {
-            'df_type': 'int',
-        }
-    ]
-
-    # Upload the data formats
-    for df in data_formats:
-        dfo, created = DataFormat.objects.get_or_create(**df)
-
-        if df.get('enum_values','').find('Disagree'):
-            disagree_df = dfo
-
-    # Define some question data as a list of dictionaries
-    question_data = [
-        {
-            'text': 'I experienced this trial to be difficult.',
-            'data_format': disagree_df,
-            'html_field_type': 'radiogroup'
-        }
-    ]
-
-    for q in question_data:
-        qo, created = Question.objects.get_or_create(**q)
-
-    # Define form data, including data that we will populate ExperimentXForm with
-    form_data = [
-        {
-            'name': 'Start Session',
-            'questions': [],
-            'form_handler': 'form_subject_register'
+
+        # Data formats, keyed by the names used to refer to them in the question specifications
+        'data_formats': {
+            'yes_no': {
+                'df_type': 'enum',
+                'enum_values': '"Yes","No"',
+            },
+            'agree_disagree': {
+                'df_type': 'enum',
+                'enum_values': '"Strongly Disagree","Somewhat Disagree","Neither Agree nor Disagree","Somewhat Agree","Strongly Agree"',
+            },
+            'int': {
+                'df_type': 'int',
+            },
         },
-        {
-            'name': 'GEM Post Trial',
-            'questions': [qo],
-            'form_handler': 'group_trial'
+
+        # Questions, keyed by the names used to refer to them in the form specifications
+        'questions': {
+            'difficulty': {
+                'text': 'I experienced this trial to be difficult.',
+                'data_format': 'agree_disagree',
+                'html_field_type': 'radiogroup'
+            },
         },
-        {
-            'name': 'End Session',
-            'questions': [],
-            'form_handler': 'form_end_session'
-        }
-    ]
 
-    # Delete any existing ExperimentXForm entries for this experiment
-    ExperimentXForm.objects.filter(experiment=eo).delete()
+        # Forms, in the order in which they are presented. A loop sends the participant back to the named form the specified number of times.
+        'forms': [
+            {
+                'name': 'Start Session',
+                'questions': [],
+                'form_handler': 'form_subject_register'
+            },
+            {
+                'name': 'GEM Post Trial',
+                'questions': ['difficulty'],
+                'form_handler': 'group_trial',
+                'stimulus_script': 'gem_control.control.init_trial()',
+                'loop': {'goto': 'GEM Post Trial', 'repeat': repeats},
+            },
+            {
+                'name': 'End Session',
+                'questions': [],
+                'form_handler': 'form_end_session'
+            }
+        ],
+    }
+
+
+# Determine whether an object matches a dict of field values, comparing related objects by primary key
+def object_matches(obj, fields):
+    for name, value in fields.items():
+        if isinstance(value, models.Model):
+            if getattr(obj, f'{name}_id') != value.pk:
+                return False
+
+        elif getattr(obj, name) != value:
+            return False
+
+    return True
+
+
+def resolve_objects(model, specs):
+    '''
+    Get the model instances matching each of the field dicts in specs, creating any that don't exist yet.
+    Existing objects are retrieved with a single query, and missing ones are created with a single bulk insert.
+    '''
+    if not specs:
+        return []
+
+    query = Q()
+    for fields in specs:
+        query |= Q(**fields)
+
+    existing = list(model.objects.filter(query))
+
+    missing = []
+    for fields in specs:
+        if not any(object_matches(obj, fields) for obj in existing) and fields not in missing:
+            missing.append(fields)
+
+    if missing:
+        model.objects.bulk_create([model(**fields) for fields in missing])
+
+        # Not all database backends set primary keys on bulk-created objects, so retrieve them again
+        existing = list(model.objects.filter(query))
+
+    return [next(obj for obj in existing if object_matches(obj, fields)) for fields in specs]
+
+
+@transaction.atomic
+def provision_experiment(spec):
+    '''
+    Create an experiment, along with its data formats, questions, forms, and form sequence, from a specification
+    such as the one returned by get_gem_experiment_spec. Existing objects are reused, and the form sequence is
+    updated in place, so provisioning the same specification again leaves the database unchanged. Everything happens in a single transaction, so a failure
+    leaves no partially created experiment behind.
+    '''
+    # Create the experiment object
+    eo, created = Experiment.objects.get_or_create(**spec['experiment'])
+
+    # Data formats
+    df_names = list(spec['data_formats'].keys())
+    data_formats = dict(zip(df_names, resolve_objects(DataFormat, [spec['data_formats'][name] for name in df_names])))
 
-    for fidx, f in enumerate(form_data, start=1):
-        fo, created = Form.objects.get_or_create(name=f['name'])
+    # Questions
+    question_names = list(spec['questions'].keys())
+    question_specs = [{**spec['questions'][name], 'data_format': data_formats[spec['questions'][name]['data_format']]} for name in question_names]
+    questions = dict(zip(question_names, resolve_objects(Question, question_specs)))
 
+    # Forms
+    forms = resolve_objects(Form, [{'name': f['name']} for f in spec['forms']])
+
+    # Link the questions into the forms
+    fxq_specs = []
+    for fo, f in zip(forms, spec['forms']):
         for idx, q in enumerate(f['questions'], start=1):
-            fqo, created = FormXQuestion.objects.get_or_create(form=fo, question=q, form_question_num=idx)
+            fxq_specs.append({'form': fo, 'question': questions[q], 'form_question_num': idx})
 
-        # Link the form into the experiment, implementing some looping logic along the way
-        goto = None
-        repeat = None
-        stimulus_script = ''
+    resolve_objects(FormXQuestion, fxq_specs)
 
-        # Trial initialization
-        if f['name'] == 'GEM Post Trial':
-            stimulus_script = 'gem_control.control.init_trial()'
+    # Reconcile the ExperimentXForm entries for this experiment with the form sequence, implementing the looping logic
+    # along the way. Entries are matched on their form and position, so existing ones keep their primary keys.
+    form_names = [f['name'] for f in spec['forms']]
 
-        # Looping logic
-        if f['name'] == 'GEM Post Trial':
-            goto = [f['name'] for f in form_data].index('GEM Post Trial')+1
-            repeat = 10
+    exf_pks = []
+    for fidx, (fo, f) in enumerate(zip(forms, spec['forms']), start=1):
+        loop = f.get('loop', {})
 
-        efo, created = ExperimentXForm.objects.get_or_create(
+        exfo, created = ExperimentXForm.objects.update_or_create(
             experiment=eo,
-            form = fo,
-            form_order = fidx,
-            form_handler = f['form_handler'],
-            goto = goto, # want to make this more dynamic if we add more forms to this example
-            repeat = repeat,
-            stimulus_script = stimulus_script
-            )
+            form=fo,
+            form_order=fidx,
+            defaults={
+                'form_handler': f['form_handler'],
+                'goto': form_names.index(loop['goto'])+1 if loop else None,
+                'repeat': loop.get('repeat'),
+                'stimulus_script': f.get('stimulus_script', ''),
+            })
+
+        exf_pks.append(exfo.pk)
+
+    # Remove entries that are no longer part of the sequence
+    ExperimentXForm.objects.filter(experiment=eo).exclude(pk__in=exf_pks).delete()
+
+    return eo
+
+
+@instrument
+def create_test_experiment(request):
+    # Instantiates necessary response options, questions, forms, and experiment to test running a GEM group experiment.
+    try:
+        repeats = int(request.GET.get('repeats', 10))
+
+    except ValueError:
+        repeats = 0
+
+    if repeats < 1:
+        return HttpResponseBadRequest('repeats must be a positive integer')
+
+    spec = get_gem_experiment_spec(
+        title=request.GET.get('title', 'GEM Test'),
+        repeats=repeats,
+        )
 
+    provision_experiment(spec)
 
     return HttpResponse('create_test_experiment: success')
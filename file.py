@@ -5,22 +5,52 @@ MISSING_DATA_VALUE = -32000
 
 import storages
 import json
+import mmap
 
+from contextlib import contextmanager
+
+import numpy as np
 import pandas as pd
 
+from .s3 import S3RangeReader
+from .cache import read_cache, write_cache
+from .stats import compute_run_stats, metronome_time_differences, TAPPER_STATS, METRONOME_STATS, GROUP_STATS
+
 import pdb
 
+# Layout of a single window record as written by GEM. Records are packed (no padding) and little-endian.
+GEM_WINDOW_DTYPE = np.dtype([
+    ('dtp_id', 'u1'),
+    ('window_num', '<u2'),
+    ('met_time', '<u4'),
+    ('asynchronies', '<i2', (GEM_MAX_TAPPERS,)),
+    ('next_met_adjust', '<i2'),
+])
+
 # GEMDataFileReader is based on GEMDataFile from GEM/GUI/GEMIO.py
 class GEMDataFileReader:
-    def __init__(self, filepath):
-        self.filepath = filepath
+    def __init__(self, filepath, use_mmap=False, lazy=False, ranged=False, cache_dir=None, columnar_cache=None, fetch=None):
+        self.init_state(filepath, use_mmap=use_mmap, lazy=lazy, ranged=ranged, cache_dir=cache_dir, columnar_cache=columnar_cache, fetch=fetch)
 
-        # Open the file
-        self.is_open = False
-        self.open()
+        # Use the cached contents of the file if we have them, otherwise open the file
+        if self.columnar_cache and self.load_columnar_cache():
+            if self.lazy:
+                return
+        else:
+            self.open()
 
-        # Read the file
-        self.read_file()
+            # In lazy mode, only the file header and run offsets are read here. Run headers and data are read when
+            # first accessed on the GEMRun objects, and verification is left to the caller.
+            if self.lazy:
+                self.read_file_header()
+                self.close()
+                return
+
+            # Read the file
+            self.read_file()
+
+            if self.columnar_cache:
+                self.write_columnar_cache()
 
         # Verify the data
         clean, verifications = self.verify()
@@ -28,44 +58,131 @@ class GEMDataFileReader:
             print(f"Found problems in {self.filepath}")
             print(verifications)
 
+    # Set up the reader's state without reading anything. Subclasses that read from other sources start from here too.
+    def init_state(self, filepath, use_mmap=False, lazy=False, ranged=False, cache_dir=None, columnar_cache=None, fetch=None):
+        self.filepath = filepath
+
+        # A fetch function of (start, end) stands in for S3, e.g. when testing ranged reads against a fake backend
+        is_remote = isinstance(self.filepath, storages.backends.s3.S3File) or fetch is not None
+
+        # Memory-map local files rather than reading them through a buffered file object
+        self.use_mmap = use_mmap and not is_remote
+        self._mmap = None
+        self._buf = None
+        self._window_buffer = None
+
+        # Read S3 files using coalesced range requests, optionally caching the fetched ranges in cache_dir
+        self.ranged = ranged and is_remote
+        self.cache_dir = cache_dir
+        self.fetch = fetch
+        self._source = None
+
+        # Keep decoded local files in a Parquet cache, either alongside the source file (True) or in the specified directory
+        self.columnar_cache = columnar_cache if not is_remote else None
+
+        self.is_open = False
+        self.lazy = lazy
+
+        # Depth of nested reading() blocks
+        self._reading = 0
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def open(self):
         mode = 'rb'
         if not self.is_open:
-            if isinstance(self.filepath, storages.backends.s3.S3File):
+            if self.ranged:
+                self._source = S3RangeReader(self.filepath, cache_dir=self.cache_dir, fetch=self.fetch)
+                self._io = None
+            elif isinstance(self.filepath, storages.backends.s3.S3File):
                 self._io = self.filepath.open(mode)
+            elif self.use_mmap:
+                self.map()
             else:
                 self._io = open(self.filepath, mode)
 
             self.is_open = True
             self.ptr = 0
 
+    def map(self):
+        # The mapping remains valid after the file handle is closed
+        with open(self.filepath, 'rb') as fid:
+            self._mmap = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._buf = memoryview(self._mmap)
+        self._io = None
+
+    @property
+    def is_mapped(self):
+        return self._buf is not None
+
     def close(self):
+        # Arrays decoded from a mapped file are views onto the mapping, so we leave the mapping in place
         if self.is_open:
-            self.ptr = self._io.tell()
-            self._io.close()
-            self._io = None
+            if self._io is not None:
+                self.ptr = self._io.tell()
+                self._io.close()
+                self._io = None
+
             self.is_open = False
 
     def reopen(self):
         if not self.is_open:
-            if isinstance(self.filepath, storages.backends.s3.S3File):
+            if self.is_mapped or self._source is not None:
+                pass
+            elif isinstance(self.filepath, storages.backends.s3.S3File):
                 self._io = self.filepath.open("rb")
+                self._io.seek(self.ptr, 0)
             else:
                 self._io = open(self.filepath, "rb")
+                self._io.seek(self.ptr, 0)
 
-            self._io.seek(self.ptr, 0)
             self.is_open = True
 
-    def read_header(self, offset):
+    # In lazy mode, the file is only held open while it is being read, so that many lazily opened readers don't hold
+    # on to a file descriptor each. Reads made within the block share one open of the file.
+    @contextmanager
+    def reading(self):
+        self._reading += 1
+
+        try:
+            yield
+
+        finally:
+            self._reading -= 1
+
+            if self.lazy and not self._reading:
+                self.close()
+
+    # Read nbytes starting at offset. For mapped files this returns a memoryview onto the mapping rather than a copy.
+    def read_bytes(self, offset, nbytes):
         self.reopen()
+
+        if self.is_mapped:
+            return self._buf[offset:offset+nbytes]
+
+        if self._source is not None:
+            return self._source.read(offset, nbytes)
+
         self._io.seek(offset, 0)
 
-        # Read the header length, stored as a uint64
-        nel_uint64 = int.from_bytes(self._io.read(8),"little")
+        return self._io.read(nbytes)
+
+    def read_header_length(self, offset):
+        # The header length is stored as a uint64
+        return int.from_bytes(self.read_bytes(offset, 8), "little")
+
+    def read_header(self, offset):
+        # Read the header length
+        nel_uint64 = self.read_header_length(offset)
 
         # Read the header
-        hdr_str = self._io.read(nel_uint64)
+        hdr_str = bytes(self.read_bytes(offset+8, nel_uint64))
 
         # Convert to a dict
         hdr_dict = json.loads(hdr_str)
@@ -77,18 +194,30 @@ class GEMDataFileReader:
         self.file_hdr = self.read_header(offset)
 
         # Determine the number of runs based on full combination of conditions
-        if "nruns" not in self.file_hdr.keys():
+        if "nruns" in self.file_hdr.keys():
+            self.nruns = self.file_hdr["nruns"]
+        else:
             self.nruns = len(self.file_hdr["metronome_alpha"])*len(self.file_hdr["metronome_tempo"])*self.file_hdr["repeats"]
 
-        # Read the run offset information
-        self.idx_map_offset = self._io.tell()
+        # Read the run offset information, stored as a table of uint64 values following the file header
+        self.idx_map_offset = offset + 8 + self.read_header_length(offset)
+
+        self.run_offsets = self.read_run_offsets()
+        self.run_info = [GEMRun(self, krun) for krun in range(0, self.nruns)]
+
+        # Decoded windows of all runs are kept in a single (runs x windows) array, of which each run holds a row.
+        # Mapped files don't need this, since their runs are views onto the mapping, and in lazy mode each run's
+        # windows are decoded into their own array as the run is read.
+        self._window_buffer = None if self.is_mapped or self.lazy else np.zeros((self.nruns, self.file_hdr['windows']), dtype=GEM_WINDOW_DTYPE)
 
-        self.run_offsets = []
-        self.run_info = []
+    # Read the table of run offsets. The table may not have been written yet if the file is still being written.
+    def read_run_offsets(self):
+        buf = self.read_bytes(self.idx_map_offset, 8*self.nruns)
 
-        for r in range(0, self.nruns):
-            self.run_offsets.append(int.from_bytes(self._io.read(8), "little"))
-            self.run_info.append(GEMRun(self))
+        if len(buf) < 8*self.nruns:
+            raise ValueError(f"Run offset table is incomplete: expected {8*self.nruns} bytes, found {len(buf)}")
+
+        return np.frombuffer(buf, dtype='<u8').tolist()
 
     def read_run_header(self, krun):
         # Read the file header and run offsets if we haven't yet
@@ -99,52 +228,105 @@ class GEMDataFileReader:
 
         # Check for valid run offset (>0)
         if offset:
-            self.run_info[krun].hdr = self.read_header(offset)
+            with self.reading():
+                self.run_info[krun].hdr = self.read_header(offset)
 
         return self.run_info[krun].hdr
 
 
-    def read_run_data(self, krun):
+    def read_run_windows(self, krun):
         # Get our run offset
         run_offset = self.run_offsets[krun]
 
         # Only read data if we have data
         if run_offset:
-            run_data = []
+            with self.reading():
+                # Skip over the run header to the start of the run data
+                data_offset = run_offset + 8 + self.read_header_length(run_offset)
+
+                # Read all of the windows in one go and decode them. For mapped files, this is a view onto the mapping.
+                nwindows = self.file_hdr['windows']
+                windows = decode_windows(self.read_bytes(data_offset, nwindows*GEM_WINDOW_DTYPE.itemsize), nwindows)
+
+            if self._window_buffer is not None:
+                self._window_buffer[krun] = windows
+                windows = self._window_buffer[krun]
+
+            self.run_info[krun].windows = windows
+
+        return self.run_info[krun].windows
+
+
+    # Re-read the run offset table, e.g. while the file is still being written. Runs whose offsets have changed are
+    # replaced with fresh GEMRun objects, and the indices of those runs are returned.
+    def refresh_run_offsets(self):
+        # Reopen the file so that we don't get served stale bytes from the read buffer
+        self.close()
+
+        with self.reading():
+            run_offsets = self.read_run_offsets()
+
+        changed = [krun for krun in range(0, self.nruns) if run_offsets[krun] != self.run_offsets[krun]]
+
+        self.run_offsets = run_offsets
+        for krun in changed:
+            self.run_info[krun] = GEMRun(self, krun)
 
-            # Seek to the start of the run
-            self._io.seek(run_offset, 0)
+        if changed:
+            self.clear_verification()
 
-            # Read the header length, stored as a uint64
-            nel_uint64 = int.from_bytes(self._io.read(8),"little")
+        return changed
 
-            # Seek to the start of the run data
-            self._io.seek(self.run_offsets[krun]+8+nel_uint64, 0)
+    # Determine whether all of a run's data have been written, given the current size of the file
+    def run_complete(self, krun, file_size):
+        run_offset = self.run_offsets[krun]
+
+        if not run_offset or file_size < run_offset + 8:
+            return False
+
+        with self.reading():
+            data_offset = run_offset + 8 + self.read_header_length(run_offset)
+
+        return file_size >= data_offset + self.file_hdr['windows']*GEM_WINDOW_DTYPE.itemsize
 
-            # Iterate over windows
-            for window_idx in range(0, self.file_hdr['windows']):
-                window_data = {}
+    # Get the byte range occupied by each run, bounded by the start of the next run in the file. The last run is bounded
+    # by the file size if given, otherwise by the size of its header and windows.
+    def get_run_spans(self, runs=None, file_size=None):
+        if runs is None:
+            runs = range(0, self.nruns)
 
-                # Get the packet content identifier
-                window_data['dtp_id'] = self._io.read(1)
+        offsets = sorted(offset for offset in self.run_offsets if offset)
 
-                # Get the serial number of the metronome tone
-                window_data['window_num'] = int.from_bytes(self._io.read(2), "little")
+        spans = []
+        for krun in runs:
+            start = self.run_offsets[krun]
+
+            if not start:
+                continue
+
+            idx = offsets.index(start)
+
+            if idx+1 < len(offsets):
+                end = offsets[idx+1]
+            elif file_size is not None:
+                end = file_size
+            else:
+                with self.reading():
+                    end = start + 8 + self.read_header_length(start) + self.file_hdr['windows']*GEM_WINDOW_DTYPE.itemsize
 
-                # Get the time of the metronome tone
-                window_data['met_time'] = int.from_bytes(self._io.read(4), "little")
+            spans.append((start, end))
 
-                # Get the tapper asynchronies
-                window_data['asynchronies'] = []
-                for tapper in range(0, GEM_MAX_TAPPERS):
-                    window_data['asynchronies'].append(int.from_bytes(self._io.read(2), "little", signed=True))
+        return spans
 
-                # Read the nex metronome adjustment
-                window_data['next_met_adjust'] = int.from_bytes(self._io.read(2), "little", signed=True)
+    # Fetch the byte ranges for the requested runs ahead of decoding them. Only has an effect for ranged S3 reads.
+    def prefetch_runs(self, runs=None):
+        if self._source is not None:
+            self._source.prefetch(self.get_run_spans(runs, file_size=self._source.size))
 
-                run_data.append(window_data)
 
-            self.run_info[krun].data = run_data
+    def read_run_data(self, krun):
+        # Decode the windows and return the list-of-dicts view of them
+        self.read_run_windows(krun)
 
         return self.run_info[krun].data
 
@@ -153,18 +335,116 @@ class GEMDataFileReader:
         # Read the file header
         self.read_file_header();
 
+        # Pull down all of the runs in as few requests as possible
+        self.prefetch_runs()
+
         # Iterate over runs. The data get stored in self.run_info
         for krun in range(0, self.nruns):
             # Read the run header
             self.read_run_header(krun)
 
             # Read the run data
-            self.read_run_data(krun)
+            self.read_run_windows(krun)
 
         # Close the file
         self.close()
 
 
+    # Get the indices of valid tappers
+    def get_valid_tapper_idxs(self):
+        return [int(subject['pad'])-1 for subject in self.file_hdr['subject_info']]
+
+
+    def get_valid_tapper_ids(self):
+        return [subject['id'] for subject in self.file_hdr['subject_info']]
+
+
+    # Stack the windows of the requested runs into a single (runs x windows) structured array. Runs without data are
+    # left out, so the indices of the runs that were stacked are returned along with the array.
+    def stack_windows(self, runs=None):
+        if runs is None:
+            runs = range(0, self.nruns)
+
+        with self.reading():
+            runs = [krun for krun in runs if self.run_info[krun].windows is not None]
+
+        if not runs:
+            return runs, np.empty((0, self.file_hdr['windows']), dtype=GEM_WINDOW_DTYPE)
+
+        return runs, np.stack([self.run_info[krun].windows for krun in runs])
+
+
+    # Extract the asynchronies of the valid tappers from stacked windows, replacing our missing data tag with NaN
+    def get_asynchrony_array(self, windows):
+        asynchronies = windows['asynchronies'][..., self.get_valid_tapper_idxs()].astype(float)
+        asynchronies[asynchronies <= MISSING_DATA_VALUE] = np.nan
+
+        return asynchronies
+
+
+    # Calculate the GEMRun.compute_stats statistics for all (or the requested) runs in one pass. The per-run stats dicts
+    # are updated, and the stacked statistics are returned along with the indices of the runs they pertain to.
+    def compute_stats(self, runs=None, skip_invalid=True, **kwargs):
+        if runs is None:
+            runs = range(0, self.nruns)
+
+        # Skip invalid runs
+        if skip_invalid:
+            invalid_runs = self.get_invalid_runs()
+            runs = [krun for krun in runs if self.run_info[krun] not in invalid_runs]
+
+        runs, windows = self.stack_windows(runs)
+
+        stats = compute_run_stats(
+            self.get_asynchrony_array(windows),
+            windows['next_met_adjust'],
+            num_pacing_clicks=kwargs.get('num_pacing_clicks', 0)
+            )
+
+        tapper_ids = self.get_valid_tapper_ids()
+
+        for ridx, krun in enumerate(runs):
+            run = self.run_info[krun]
+
+            run.tapper_stats.update({
+                tapper_id: {stat: stats[stat][ridx, tidx].item() for stat in TAPPER_STATS}
+                for tidx, tapper_id in enumerate(tapper_ids)
+            })
+            run.metronome_stats.update({stat: stats[stat][ridx].item() for stat in METRONOME_STATS})
+            run.group_stats.update({stat: stats[stat][ridx].item() for stat in GROUP_STATS})
+
+        stats['runs'] = runs
+
+        return stats
+
+
+    @property
+    def columnar_cache_dir(self):
+        return None if self.columnar_cache is True else self.columnar_cache
+
+    # Write the decoded file to the columnar cache
+    def write_columnar_cache(self):
+        return write_cache(self, self.columnar_cache_dir)
+
+    # Populate the file header, run headers, and run data from the columnar cache
+    def load_columnar_cache(self):
+        cached = read_cache(self.filepath, self.columnar_cache_dir)
+
+        if cached is None:
+            return False
+
+        self.file_hdr = cached['file_hdr']
+        self.nruns = cached['nruns']
+        self.run_offsets = cached['run_offsets']
+        self.run_info = [GEMRun(self, krun) for krun in range(0, self.nruns)]
+
+        for krun, run in enumerate(self.run_info):
+            run.hdr = cached['run_hdrs'][krun]
+            run.windows = cached['windows'].get(krun)
+
+        return True
+
+
     def verify(self):
         all_checks_passed = True
 
@@ -183,32 +463,85 @@ class GEMDataFileReader:
         return all_checks_passed, verifications
 
 
+    # Discard the cached results of verify() so that they are recomputed
+    def clear_verification(self):
+        for attr in ['_missing_runs', '_invalid_runs', '_all_run_data_present', '_all_runs_valid']:
+            if hasattr(self, attr):
+                delattr(self, attr)
+
+
     def get_missing_runs(self):
         if not hasattr(self, "_missing_runs"):
             self._missing_runs = []
 
-            for idx, run in enumerate(self.run_info):
-                if not run.hdr:
-                    self._missing_runs.append(idx+1)
+            with self.reading():
+                for idx, run in enumerate(self.run_info):
+                    if not run.hdr:
+                        self._missing_runs.append(idx+1)
 
         return self._missing_runs
 
 
+    # Check the metronome times of all (or the requested) runs at once. Returns a report with one row per problem:
+    # either a run that has no header or data, or a window whose metronome time differs from the expected time.
+    def check_metronome(self, runs=None, tolerance=0):
+        if runs is None:
+            runs = range(0, self.nruns)
+
+        report = []
+
+        # Runs without a header or data can't be checked
+        checkable = []
+        with self.reading():
+            for krun in runs:
+                run = self.run_info[krun]
+
+                if not run.hdr or run.windows is None:
+                    report.append({'run': krun, 'run_number': run.hdr.get('run_number', krun+1), 'problem': 'missing_run', 'window': None, 'time_difference': None})
+                else:
+                    checkable.append(krun)
+
+        checkable, windows = self.stack_windows(checkable)
+
+        time_differences = metronome_time_differences(
+            windows['met_time'].astype(float),
+            windows['next_met_adjust'].astype(float),
+            [self.run_info[krun].hdr['tempo'] for krun in checkable]
+            )
+
+        for ridx, widx in zip(*np.nonzero(np.abs(time_differences) > tolerance)):
+            krun = checkable[ridx]
+
+            report.append({
+                'run': krun,
+                'run_number': self.run_info[krun].hdr['run_number'],
+                'problem': 'met_time_mismatch',
+                'window': int(widx)+1,
+                'time_difference': time_differences[ridx, widx].item(),
+            })
+
+        report = pd.DataFrame(report, columns=['run', 'run_number', 'problem', 'window', 'time_difference'])
+
+        return report.astype({'window': 'Int64'}).sort_values(['run', 'window'], ignore_index=True)
+
+
     def get_invalid_runs(self):
         if not hasattr(self, "_invalid_runs"):
-            self._invalid_runs = []
+            report = self.check_metronome()
 
-            for idx, run in enumerate(self.run_info):
-                try:
-                    run.verify_metronome_values()
-
-                except:
-                    self._invalid_runs.append(run)
-                    continue
+            self._invalid_runs = [self.run_info[krun] for krun in sorted(set(report['run']))]
 
         return self._invalid_runs         
 
 
+    # Determine whether a single run is valid. Unless the whole file has already been checked, only this run is read and checked.
+    def is_run_valid(self, krun):
+        if hasattr(self, "_invalid_runs"):
+            return self.run_info[krun] not in self._invalid_runs
+
+        return self.check_metronome(runs=[krun]).empty
+
+
     @property
     def all_run_data_present(self):
         if not hasattr(self, "_all_run_data_present"):
@@ -231,26 +564,92 @@ class GEMDataFileReader:
     
 
 class GEMRun:
+    # Files can contain hundreds of runs, so we keep the per-run footprint small
+    __slots__ = ['parent', 'krun', '_hdr', '_windows', '_windows_read', '_data', 'tapper_stats', 'metronome_stats', 'group_stats', '_df']
 
-    def __init__(self, parent):
+    def __init__(self, parent, krun=None):
         self.parent = parent
+        self.krun = krun
 
-        self.hdr = {}
-        self.data = []
+        # The run header and windows are read from the parent file on first access
+        self._hdr = None
+        self._windows = None
+        self._windows_read = False
+        self._data = None
         self.tapper_stats = {}
         self.metronome_stats = {}
         self.group_stats = {}
-        self._df = pd.DataFrame()
 
-        # Create a dataframe 
-        self.get_data_frame()
+        # The DataFrame is only created when requested
+        self._df = None
 
     def __repr__(self):
         return json.dumps(self.hdr)
 
+    @property
+    def hdr(self):
+        if self._hdr is None:
+            self._hdr = {}
+
+            if self.krun is not None:
+                self.parent.read_run_header(self.krun)
+
+        return self._hdr
+
+    @hdr.setter
+    def hdr(self, value):
+        self._hdr = value
+
+    @property
+    def windows(self):
+        if not self._windows_read:
+            self._windows_read = True
+
+            if self.krun is not None:
+                self.parent.read_run_windows(self.krun)
+
+        return self._windows
+
+    @windows.setter
+    def windows(self, value):
+        self._windows_read = True
+        self._windows = value
+
+    # List of per-window dicts, built from the decoded windows on first access
+    @property
+    def data(self):
+        if self._data is None:
+            if self.windows is None:
+                return []
+
+            self._data = windows_to_dicts(self.windows)
+
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    # Column arrays for the decoded windows. Asynchronies are returned as a (windows x tappers) array.
+    def get_columns(self):
+        if self.windows is None:
+            return {}
+
+        return {name: self.windows[name] for name in GEM_WINDOW_DTYPE.names}
+
     def get_data_frame(self):
-        if self._df.empty:
-            self._df = pd.DataFrame(self.data)
+        if self._df is None or self._df.empty:
+            if self.windows is not None:
+                columns = self.get_columns()
+                self._df = pd.DataFrame({
+                    'dtp_id': [bytes([v]) for v in columns['dtp_id'].tolist()],
+                    'window_num': columns['window_num'],
+                    'met_time': columns['met_time'],
+                    'asynchronies': columns['asynchronies'].tolist(),
+                    'next_met_adjust': columns['next_met_adjust'],
+                })
+            else:
+                self._df = pd.DataFrame(self.data)
 
         return self._df
 
@@ -283,17 +682,17 @@ class GEMRun:
 
     # Get the indices of valid tappers
     def get_valid_tapper_idxs(self):
-        return [int(subject['pad'])-1 for subject in self.parent.file_hdr['subject_info']]
+        return self.parent.get_valid_tapper_idxs()
 
 
     def get_valid_tapper_ids(self):
-        return [subject['id'] for subject in self.parent.file_hdr['subject_info']]
+        return self.parent.get_valid_tapper_ids()
 
 
     # Calculate various statistics
     def compute_stats(self, **kwargs):
-        if self in self.parent._invalid_runs:
-            print(f"Run {self.hdr['run_number']} is invalid. Skipping ...")
+        if not self.parent.is_run_valid(self.krun):
+            print(f"Run {self.hdr.get('run_number', self.krun+1)} is invalid. Skipping ...")
             return
 
         # Get our tappers
@@ -389,3 +788,28 @@ class GEMRun:
 
 def replace_missing(values):
     return [v if v > MISSING_DATA_VALUE else pd.NA for v in values]
+
+
+# Decode a block of packed window records into a structured array
+def decode_windows(buf, nwindows):
+    return np.frombuffer(buf, dtype=GEM_WINDOW_DTYPE, count=nwindows)
+
+
+# Convert decoded windows into the list of per-window dicts originally returned by read_run_data
+def windows_to_dicts(windows):
+    return [
+        {
+            'dtp_id': bytes([dtp_id]),
+            'window_num': window_num,
+            'met_time': met_time,
+            'asynchronies': asynchronies,
+            'next_met_adjust': next_met_adjust,
+        }
+        for dtp_id, window_num, met_time, asynchronies, next_met_adjust in zip(
+            windows['dtp_id'].tolist(),
+            windows['window_num'].tolist(),
+            windows['met_time'].tolist(),
+            windows['asynchronies'].tolist(),
+            windows['next_met_adjust'].tolist(),
+        )
+    ]
@@ -0,0 +1,65 @@
+# follow.py
+#
+# Methods for monitoring a GEM data file while it is being written during a session
+
+import os
+import time
+
+from .file import GEMDataFileReader
+
+import pdb
+
+
+# Open a file that may not exist yet, or whose header may not have been written yet
+def wait_for_reader(filepath, poll_interval=1.0, timeout=None):
+    start_time = time.time()
+
+    while True:
+        try:
+            return GEMDataFileReader(filepath, lazy=True)
+
+        except (FileNotFoundError, ValueError):
+            if timeout is not None and time.time()-start_time > timeout:
+                raise
+
+            time.sleep(poll_interval)
+
+
+def follow_file(filepath, poll_interval=1.0, timeout=None, **kwargs):
+    '''
+    Yield each GEMRun of a file as soon as all of its data have been written, with its statistics computed.
+
+    The file's run offset table is polled every poll_interval seconds, and only the header and windows of newly
+    completed runs are read. Following stops once all runs have been yielded, or when no new run has been completed
+    within timeout seconds. Remaining keyword arguments, e.g. num_pacing_clicks, are passed to compute_stats.
+    Runs that fail metronome verification are yielded without statistics.
+    '''
+    reader = wait_for_reader(filepath, poll_interval=poll_interval, timeout=timeout)
+
+    pending = set(range(0, reader.nruns))
+    last_completed_time = time.time()
+
+    while pending:
+        reader.refresh_run_offsets()
+
+        file_size = os.path.getsize(filepath)
+        completed = sorted(krun for krun in pending if reader.run_complete(krun, file_size))
+
+        for krun in completed:
+            pending.remove(krun)
+
+            if reader.check_metronome(runs=[krun]).empty:
+                reader.compute_stats(runs=[krun], skip_invalid=False, **kwargs)
+
+            yield reader.run_info[krun]
+
+        if completed:
+            last_completed_time = time.time()
+
+        elif timeout is not None and time.time()-last_completed_time > timeout:
+            break
+
+        if pending:
+            time.sleep(poll_interval)
+
+    reader.close()
@@ -4,18 +4,68 @@ import django.forms as forms
 from django.core.validators import MaxValueValidator, MinValueValidator 
 
 from .settings import GEM_SETTINGS
+from .schedule import get_generator
+
+# Check that a value is a number or a non-empty list of numbers, and return it as a list. None is passed through.
+def clean_number_list(value):
+    if value is None:
+        return None
+
+    if not isinstance(value, list):
+        value = [value]
+
+    if not value or not all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in value):
+        raise forms.ValidationError('Enter a number or a non-empty list of numbers.')
+
+    return value
 
 class ExperimentInitForm(forms.Form):
     tappers_requested = forms.IntegerField(initial=1, validators=[MinValueValidator(1), MaxValueValidator(GEM_SETTINGS['max_tappers'])])
 
-    # metronome_alpha = forms.JSONField()
-    # metronome_tempo = forms.FloatField(initial=120.0)   #units: beats-per-minute
-    # repeats = forms.IntegerField(initial=10, validators=[MinValueValidator(1)])    #number of rounds at each alpha
+    # The following are only needed if the trial schedule is to be generated at initialization
+    metronome_alpha = forms.JSONField(required=False)
+    metronome_tempo = forms.JSONField(required=False)   #units: beats-per-minute; a single value or a list
+    repeats = forms.IntegerField(required=False, initial=10, validators=[MinValueValidator(1)])    #number of rounds at each alpha
+    seed = forms.IntegerField(required=False)   # seed for randomizing the trial order
     # windows = forms.IntegerField(initial=26, validators=[MinValueValidator(1)])    #number of metronome clicks; Fairhurst = 24
     audio_feedback = forms.ChoiceField(choices=GEM_SETTINGS['feedback_options'])
 
-    trial_generator = forms.CharField(initial='fully_random')  # either a keyword string, e.g. 'fully_random', or a module and method for generating a trial list
+    trial_generator = forms.CharField(initial='fully_random')  # either a keyword string, e.g. 'fully_random', or a module and method for generating a trial list, as listed in GEM_SETTINGS['trial_generators']
+
+    def clean_trial_generator(self):
+        trial_generator = self.cleaned_data['trial_generator']
+
+        try:
+            get_generator(trial_generator)
+
+        except (ValueError, ImportError) as err:
+            raise forms.ValidationError(str(err))
+
+        return trial_generator
+
+    def clean_metronome_alpha(self):
+        return clean_number_list(self.cleaned_data['metronome_alpha'])
+
+    def clean_metronome_tempo(self):
+        return clean_number_list(self.cleaned_data['metronome_tempo'])
+
+    # The trial schedule is only generated if the generator's parameters are given, so either all or none of them must be
+    def clean(self):
+        cleaned_data = super().clean()
+
+        if 'trial_generator' not in cleaned_data:
+            return cleaned_data
+
+        required_params = getattr(get_generator(cleaned_data['trial_generator']), 'required_params', [])
+        missing = [name for name in required_params if cleaned_data.get(name) is None and name not in self.errors]
+
+        if missing and len(missing) < len(required_params):
+            for name in missing:
+                self.add_error(name, 'This field is required to generate the trial schedule.')
+
+        return cleaned_data
 
 class TrialInitForm(forms.Form):
-    trial_num = forms.IntegerField()
-    params = forms.JSONField()
+    # If the experiment has a trial schedule, these can be omitted, in which case the next trial in the schedule is initialized
+    trial_num = forms.IntegerField(required=False)
+    params = forms.JSONField(required=False)
@@ -0,0 +1,180 @@
+# journal.py
+#
+# Append-only journal of group session transitions. Events are buffered in memory and written with bulk inserts,
+# either when the buffer fills up, when it gets old, or at a trial boundary.
+#
+# The journal is stored in the TrialEvent model, so gem_control must be in INSTALLED_APPS and migrated. Otherwise
+# events are dropped, with a warning, and the rest of gem_control works as before.
+
+import time
+import atexit
+import threading
+
+from django.apps import apps
+from django.db import connections, models
+
+import logging
+logger = logging.getLogger(__name__)
+
+import pdb
+
+# Number of buffered events that triggers a flush
+JOURNAL_FLUSH_SIZE = 100
+
+# Age, in seconds, of the oldest buffered event that triggers a flush. Buffered events are also flushed by a timer
+# after this long, so at most this much of the journal is lost if a worker process is killed.
+JOURNAL_FLUSH_AGE = 5
+
+
+# The journaled events. These are defined here rather than on the model, so that they can be used without the model.
+class Events(models.TextChoices):
+    EXPERIMENT_INIT = 'experiment_init'
+    TRIAL_INIT_REQUESTED = 'trial_init_requested'
+    GROUP_READY = 'group_ready'
+    TRIAL_START = 'trial_start'
+    TRIAL_END = 'trial_end'
+    LOOP_EXIT = 'loop_exit'
+    RESPONSE_RECORDED = 'response_recorded'
+
+# Events at trial boundaries, which trigger an immediate flush
+JOURNAL_FLUSH_EVENTS = [Events.EXPERIMENT_INIT, Events.TRIAL_START, Events.TRIAL_END, Events.LOOP_EXIT]
+
+
+# Get the TrialEvent model, or None if gem_control isn't an installed app
+def get_event_model():
+    app_config = apps.get_containing_app_config(__name__)
+
+    if app_config is None:
+        return None
+
+    return app_config.get_model('TrialEvent')
+
+
+class EventJournal:
+    def __init__(self, flush_size=JOURNAL_FLUSH_SIZE, flush_age=JOURNAL_FLUSH_AGE):
+        self.flush_size = flush_size
+        self.flush_age = flush_age
+
+        self._events = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._warned = False
+
+    def record(self, group_session_id, event, trial_num=None, **data):
+        model = get_event_model()
+
+        if model is None:
+            if not self._warned:
+                logger.warning('gem_control is not in INSTALLED_APPS, so trial events are not journaled')
+                self._warned = True
+
+            return
+
+        with self._lock:
+            self._events.append(model(
+                group_session_id=group_session_id,
+                trial_num=trial_num,
+                event=event,
+                timestamp_ns=time.time_ns(),
+                data=data,
+                ))
+
+            flush = len(self._events) >= self.flush_size \
+                or time.time_ns()-self._events[0].timestamp_ns >= self.flush_age*1e9 \
+                or event in JOURNAL_FLUSH_EVENTS
+
+            # Make sure that events that don't trigger a flush don't linger in the buffer
+            if not flush and self._timer is None:
+                self._timer = threading.Timer(self.flush_age, self.flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if events:
+            events[0].__class__.objects.bulk_create(events)
+
+        return len(events)
+
+    def flush_on_timer(self):
+        try:
+            self.flush()
+
+        except Exception:
+            logger.exception('Failed to flush the trial event journal')
+
+        finally:
+            # The timer thread opened its own database connection
+            connections.close_all()
+
+journal = EventJournal()
+
+# Don't lose buffered events when the process exits
+atexit.register(journal.flush)
+
+
+def record_event(group_session_id, event, trial_num=None, **data):
+    journal.record(group_session_id, event, trial_num=trial_num, **data)
+
+
+# Phases of a trial, each defined by the events that start and end it
+TRIAL_PHASES = {
+    'group_ready_wait': (Events.TRIAL_INIT_REQUESTED, Events.GROUP_READY),
+    'start_delay': (Events.GROUP_READY, Events.TRIAL_START),
+    'trial': (Events.TRIAL_START, Events.TRIAL_END),
+    'responses': (Events.TRIAL_END, Events.RESPONSE_RECORDED),
+}
+
+def get_phase_durations(group_session_id):
+    '''
+    Get the duration, in milliseconds, of each phase of each trial of a group session. Where an event occurs
+    more than once in a trial, e.g. responses from multiple participants, the last occurrence is used. The
+    inter_trial duration runs from the end of a trial to the request to initialize the next trial.
+    '''
+    # Make sure any events from this process are included
+    journal.flush()
+
+    model = get_event_model()
+
+    if model is None:
+        return []
+
+    events = model.objects.filter(group_session_id=group_session_id).values_list('trial_num', 'event', 'timestamp_ns')
+
+    # Get the time of each event within each trial
+    trial_events = {}
+    for trial_num, event, timestamp_ns in events:
+        if trial_num is None:
+            continue
+
+        trial_events.setdefault(trial_num, {})[event] = timestamp_ns
+
+    durations = []
+    for trial_num in sorted(trial_events):
+        times = trial_events[trial_num]
+        trial_durations = {'trial_num': trial_num}
+
+        for phase, (start_event, end_event) in TRIAL_PHASES.items():
+            if start_event in times and end_event in times:
+                trial_durations[phase] = (times[end_event]-times[start_event])/1e6
+            else:
+                trial_durations[phase] = None
+
+        next_times = trial_events.get(trial_num+1, {})
+        if Events.TRIAL_END in times and Events.TRIAL_INIT_REQUESTED in next_times:
+            trial_durations['inter_trial'] = (next_times[Events.TRIAL_INIT_REQUESTED]-times[Events.TRIAL_END])/1e6
+        else:
+            trial_durations['inter_trial'] = None
+
+        durations.append(trial_durations)
+
+    return durations
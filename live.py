@@ -0,0 +1,221 @@
+# live.py
+#
+# Running statistics of the window data streamed by the GEM GUI during a trial. Each window updates the statistics in
+# constant time using Welford's online mean and variance, so that the run-level statistics computed by
+# GEMRun.compute_stats are available as soon as the trial ends, without waiting for the data file to be parsed.
+
+import math
+
+from django.core.cache import cache
+
+import polling2
+
+from .file import GEM_MAX_TAPPERS, MISSING_DATA_VALUE
+from .context import cache_lock
+from .stats import TAPPER_STATS, METRONOME_STATS, GROUP_STATS
+
+import pdb
+
+# How long live statistics are retained, and how long to wait for another request updating the same trial
+LIVE_STATS_CACHE_TIMEOUT = 60*60*12
+LIVE_STATS_LOCK_TIMEOUT = 5
+
+
+def get_live_stats_key(session_id, trial_num):
+    return f'gem_control:groupsession:{session_id}:live:{trial_num}'
+
+def get_live_lock_key(session_id, trial_num):
+    return f'gem_control:groupsession:{session_id}:live:{trial_num}:lock'
+
+
+class RunningStat:
+    '''
+    Welford's online count, mean, and sample variance (ddof=1). NaN values are skipped, as in pandas.
+    '''
+    __slots__ = ['count', 'mean', 'm2']
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        if value is None or math.isnan(value):
+            return
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(value - self.mean)
+
+    def get_mean(self):
+        return self.mean if self.count else math.nan
+
+    def get_std(self):
+        return math.sqrt(self.m2/(self.count-1)) if self.count > 1 else math.nan
+
+
+def mean_std(values):
+    stat = RunningStat()
+
+    for value in values:
+        stat.add(value)
+
+    return stat.get_mean(), stat.get_std()
+
+
+class LiveRunStats:
+    '''
+    Running per-tapper, metronome, and group statistics of a single trial. The statistics and their handling of
+    pacing clicks match GEMRun.compute_stats: the per-tapper and metronome statistics exclude the first
+    num_pacing_clicks windows, whereas the group statistics include them.
+    '''
+    def __init__(self, tapper_idxs, tapper_ids=None, num_pacing_clicks=0):
+        self.tapper_idxs = list(tapper_idxs)
+        self.tapper_ids = list(tapper_ids) if tapper_ids is not None else self.tapper_idxs
+        self.num_pacing_clicks = num_pacing_clicks
+
+        self.num_windows = 0
+        self.last_met_time = None
+
+        self.num_missed = [0]*len(self.tapper_idxs)
+        self.async_rel_met = [RunningStat() for _ in self.tapper_idxs]
+        self.async_rel_grp = [RunningStat() for _ in self.tapper_idxs]
+        self.met_adjust = RunningStat()
+        self.grp_mean_asynch = RunningStat()
+        self.grp_std_asynch = RunningStat()
+
+    def add_window(self, asynchronies, next_met_adjust, met_time=None):
+        # Extract the asynchronies of our tappers, replacing missing data with NaN
+        values = [asynchronies[idx] for idx in self.tapper_idxs]
+        values = [float(value) if value > MISSING_DATA_VALUE else math.nan for value in values]
+
+        # Per-window group statistics
+        window_mean, window_std = mean_std(values)
+
+        self.grp_mean_asynch.add(window_mean)
+        self.grp_std_asynch.add(window_std)
+
+        # Per-tapper and metronome statistics, excluding the pacing clicks
+        if self.num_windows >= self.num_pacing_clicks:
+            for ktapper, value in enumerate(values):
+                if math.isnan(value):
+                    self.num_missed[ktapper] += 1
+
+                self.async_rel_met[ktapper].add(value)
+                self.async_rel_grp[ktapper].add(value - window_mean)
+
+            self.met_adjust.add(float(next_met_adjust))
+
+        self.num_windows += 1
+        self.last_met_time = met_time
+
+    def get_stats(self):
+        tapper_stats = {}
+
+        for ktapper, tapper_id in enumerate(self.tapper_ids):
+            tapper_stats[tapper_id] = dict(zip(TAPPER_STATS, [
+                self.num_missed[ktapper],
+                self.async_rel_met[ktapper].get_mean(),
+                self.async_rel_met[ktapper].get_std(),
+                self.async_rel_grp[ktapper].get_mean(),
+                self.async_rel_grp[ktapper].get_std(),
+            ]))
+
+        return {
+            'num_windows': self.num_windows,
+            'last_met_time': self.last_met_time,
+            'tapper_stats': tapper_stats,
+            'metronome_stats': dict(zip(METRONOME_STATS, [self.met_adjust.get_mean(), self.met_adjust.get_std()])),
+            'group_stats': dict(zip(GROUP_STATS, [
+                self.grp_mean_asynch.get_mean(),
+                self.grp_mean_asynch.get_std(),
+                self.grp_std_asynch.get_mean(),
+                self.grp_std_asynch.get_std(),
+            ])),
+        }
+
+
+# Replace NaN values, which aren't valid JSON, with None
+def nan_to_none(value):
+    if isinstance(value, dict):
+        return {key: nan_to_none(item) for key, item in value.items()}
+
+    if isinstance(value, float) and math.isnan(value):
+        return None
+
+    return value
+
+
+def get_live_stats(session_id, trial_num):
+    return cache.get(get_live_stats_key(session_id, trial_num))
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_windows(windows, tapper_idxs):
+    '''
+    Check that windows is a list of windows that each have a numeric asynchrony for every one of tapper_idxs and a
+    numeric next_met_adjust. Raises a ValueError describing the first problem found.
+    '''
+    if not isinstance(windows, list):
+        raise ValueError('windows must be a list')
+
+    if not all(isinstance(idx, int) and idx >= 0 for idx in tapper_idxs):
+        raise ValueError('tapper_idxs must be non-negative integers')
+
+    num_pads = max(tapper_idxs, default=-1) + 1
+
+    for kwindow, window in enumerate(windows):
+        if not isinstance(window, dict):
+            raise ValueError(f'Window {kwindow} is not an object')
+
+        asynchronies = window.get('asynchronies')
+
+        if not isinstance(asynchronies, list) or len(asynchronies) < num_pads:
+            raise ValueError(f'Window {kwindow} must have a list of at least {num_pads} asynchronies')
+
+        if not all(is_number(asynchronies[idx]) for idx in tapper_idxs):
+            raise ValueError(f'Window {kwindow} has non-numeric asynchronies')
+
+        if not is_number(window.get('next_met_adjust')):
+            raise ValueError(f'Window {kwindow} must have a numeric next_met_adjust')
+
+
+def ingest_windows(session_id, trial_num, windows, tapper_idxs=None, tapper_ids=None, num_pacing_clicks=0):
+    '''
+    Add a batch of windows, each a dict with asynchronies (one per pad), next_met_adjust, and optionally met_time, to
+    the live statistics of a trial. The tappers and number of pacing clicks are taken from the first batch of a trial.
+
+    Batches for the same trial are applied one at a time, guarded by a lock in the cache. Returns the updated
+    LiveRunStats, or None if the lock couldn't be acquired. Raises a ValueError, before anything is applied, if any
+    of the windows is malformed.
+    '''
+    if tapper_idxs is None:
+        tapper_idxs = range(0, GEM_MAX_TAPPERS)
+
+    if not isinstance(num_pacing_clicks, int):
+        raise ValueError('num_pacing_clicks must be an integer')
+
+    # The tappers of a trial are fixed by its first batch, so the windows are checked against those if there are any
+    live_stats = get_live_stats(session_id, trial_num)
+    validate_windows(windows, live_stats.tapper_idxs if live_stats is not None else list(tapper_idxs))
+
+    try:
+        with cache_lock(get_live_lock_key(session_id, trial_num), timeout=LIVE_STATS_LOCK_TIMEOUT, wait=LIVE_STATS_LOCK_TIMEOUT):
+            live_stats = get_live_stats(session_id, trial_num)
+
+            if live_stats is None:
+                live_stats = LiveRunStats(tapper_idxs, tapper_ids=tapper_ids, num_pacing_clicks=num_pacing_clicks)
+
+            for window in windows:
+                live_stats.add_window(window['asynchronies'], window['next_met_adjust'], met_time=window.get('met_time'))
+
+            cache.set(get_live_stats_key(session_id, trial_num), live_stats, LIVE_STATS_CACHE_TIMEOUT)
+
+    except polling2.TimeoutException:
+        return None
+
+    return live_stats
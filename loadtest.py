@@ -0,0 +1,415 @@
+# loadtest.py
+#
+# Load testing of the gem_control endpoints by simulating concurrent group sessions. Each simulated group consists
+# of a GEMGUI client and its participant clients, driven either through the Django test client, i.e. through the full
+# URL routing and middleware stack, or over HTTP against a live server thread. The load test runs against a test
+# database that is created for it and destroyed afterwards, so the configured database is never touched.
+
+import os
+import json
+import time
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from contextlib import contextmanager
+
+import numpy as np
+
+from django.conf import settings
+from django.db import connection, connections
+from django.contrib.auth import get_user, get_user_model
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.test import Client, RequestFactory, override_settings, modify_settings
+from django.test.testcases import LiveServerThread, _StaticFilesHandler
+from django.test.utils import setup_databases, teardown_databases, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from pyensemble.models import Session
+from pyensemble.group.models import GroupSession, GroupSessionSubjectSession
+
+from .settings import GEM_SETTINGS
+from .metrics import metrics
+from .journal import journal
+from .create import provision_experiment, get_gem_experiment_spec
+from . import control
+
+import pdb
+
+# The experiment and user created by the default setup
+LOADTEST_EXPERIMENT_TITLE = 'GEM Load Test'
+LOADTEST_USERNAME = 'gem_loadtest'
+
+# The Django session key under which PyEnsemble stores the group session a client is attached to
+GROUP_SESSION_ID_KEY = 'group_session_id'
+
+# Prefix of the cache keys written during a load test, which keeps them apart from those of the running site
+LOADTEST_CACHE_PREFIX = 'gem_loadtest'
+
+# The host on which the live server listens
+LIVE_SERVER_HOST = 'localhost'
+
+
+class SimulatedGroup:
+    '''
+    The clients making up one simulated group session.
+
+    gui: a logged-in django.test.Client that is bound to the group session as the experimenter (GEMGUI) client
+    participants: a list of (client, session_id) tuples, one per participant, where session_id is the participant's PyEnsemble session ID
+
+    When the load test runs against a live server, the test clients are replaced by LiveServerClients with the same sessions.
+    mark_ready: optional callable(client, session_id) that marks a participant as ready for the next trial, as PyEnsemble does when a participant is served their next form
+
+    done is set when the GUI client stops, whether or not it got through all of its trials, so that the participants
+    stop waiting for trials that will never be initialized.
+    '''
+    def __init__(self, gui, participants, mark_ready=None):
+        self.gui = gui
+        self.participants = participants
+        self.mark_ready = mark_ready
+        self.done = threading.Event()
+
+
+class LoadTestResult:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = []
+        self.elapsed = None
+        self.view_metrics = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, latency_ms, status=None):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(latency_ms)
+
+            if status is not None and status >= 400:
+                self.errors.append({'endpoint': endpoint, 'status': status})
+
+    def summary(self):
+        summary = []
+
+        for endpoint, latencies in sorted(self.latencies.items()):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            view_metrics = self.view_metrics.get(endpoint, {})
+
+            summary.append({
+                'endpoint': endpoint,
+                'requests': len(latencies),
+                'throughput': len(latencies)/self.elapsed if self.elapsed else None,
+                'p50_ms': p50,
+                'p95_ms': p95,
+                'p99_ms': p99,
+                'max_ms': max(latencies),
+                'db_queries_mean': view_metrics.get('db_queries', {}).get('mean'),
+                'errors': sum(1 for error in self.errors if error['endpoint'] == endpoint),
+            })
+
+        return summary
+
+
+class LiveServerResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class LiveServerClient:
+    '''
+    Issues HTTP requests to a live server with the session of a logged-in django.test.Client, so that requests go
+    through a real server, including its request parsing, CSRF checks, and thread handling.
+    '''
+    def __init__(self, base_url, client):
+        self.base_url = base_url
+        self.client = client
+
+        # Requests are checked against a CSRF token of our own, as a browser would get from a rendered form
+        self.csrf_token = get_random_string(CSRF_SECRET_LENGTH, allowed_chars=CSRF_ALLOWED_CHARS)
+
+        cookies = {name: morsel.value for name, morsel in client.cookies.items()}
+        cookies[settings.CSRF_COOKIE_NAME] = self.csrf_token
+        self.cookie_header = '; '.join(f'{name}={value}' for name, value in cookies.items())
+
+    @property
+    def session(self):
+        return self.client.session
+
+    def request(self, method, path, data=None):
+        url = self.base_url + path
+        query = urllib.parse.urlencode(data or {})
+        headers = {'Cookie': self.cookie_header}
+        body = None
+
+        if method == 'GET':
+            url = f'{url}?{query}' if query else url
+        else:
+            body = query.encode()
+            headers.update({
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'X-CSRFToken': self.csrf_token,
+                })
+
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=body, headers=headers, method=method)) as response:
+                return LiveServerResponse(response.status, response.read())
+
+        except urllib.error.HTTPError as err:
+            return LiveServerResponse(err.code, err.read())
+
+    def get(self, path, data=None):
+        return self.request('GET', path, data)
+
+    def post(self, path, data=None):
+        return self.request('POST', path, data)
+
+
+# Start a live server thread serving the project, sharing in-memory SQLite test databases with it as
+# LiveServerTestCase does
+def start_live_server():
+    connections_override = {conn.alias: conn for conn in connections.all() if conn.vendor == 'sqlite' and conn.is_in_memory_db()}
+
+    server = LiveServerThread(LIVE_SERVER_HOST, _StaticFilesHandler, connections_override=connections_override)
+    server.daemon = True
+    server.start()
+    server.is_ready.wait()
+
+    if server.error:
+        raise server.error
+
+    return server
+
+
+@contextmanager
+def loadtest_environment(live_server=False):
+    '''
+    Set up the environment in which a load test runs: a test database, created from the migrations and destroyed
+    afterwards, and cache keys that are prefixed to keep them apart from those of the running site. If live_server
+    is True, a live server thread is started, and its URL is yielded; otherwise None is yielded.
+    '''
+    loadtest_caches = {alias: {**config, 'KEY_PREFIX': f"{LOADTEST_CACHE_PREFIX}{config.get('KEY_PREFIX', '')}"} for alias, config in settings.CACHES.items()}
+
+    # Concurrent clients lock each other out of an in-memory SQLite database, so SQLite test databases are put in files
+    tmpdir = tempfile.TemporaryDirectory()
+    sqlite_test_settings = [conn.settings_dict['TEST'] for conn in connections.all() if conn.vendor == 'sqlite' and not conn.settings_dict['TEST'].get('NAME')]
+
+    for kdb, test_settings in enumerate(sqlite_test_settings):
+        test_settings['NAME'] = os.path.join(tmpdir.name, f'loadtest{kdb}.sqlite3')
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+
+    try:
+        with override_settings(CACHES=loadtest_caches), modify_settings(ALLOWED_HOSTS={'append': LIVE_SERVER_HOST}):
+            if not live_server:
+                yield None
+                return
+
+            server = start_live_server()
+
+            try:
+                yield f'http://{server.host}:{server.port}'
+
+            finally:
+                server.terminate()
+
+    finally:
+        # Write buffered trial events while the test database still exists, rather than to the configured one later
+        journal.flush()
+
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+        for test_settings in sqlite_test_settings:
+            test_settings['NAME'] = None
+
+        tmpdir.cleanup()
+
+
+# Issue a request through a test client and record its latency
+def timed_request(result, client, method, endpoint, data=None):
+    start = time.perf_counter()
+    response = getattr(client, method)(reverse(f'gem_control:{endpoint}'), data=data)
+    result.record(endpoint, (time.perf_counter()-start)*1000, response.status_code)
+
+    return response
+
+
+def run_gui(group, result, num_trials, experiment_params, trial_duration):
+    gui = group.gui
+
+    try:
+        timed_request(result, gui, 'post', 'init_experiment', experiment_params)
+
+        for trial_num in range(1, num_trials+1):
+            timed_request(result, gui, 'get', 'init_trial')
+
+            response = timed_request(result, gui, 'post', 'init_trial', {'trial_num': trial_num})
+            if response.status_code != 202:
+                break
+
+            timed_request(result, gui, 'post', 'start_trial')
+            time.sleep(trial_duration)
+            timed_request(result, gui, 'post', 'end_trial')
+
+        timed_request(result, gui, 'post', 'exit_loop')
+
+    finally:
+        group.done.set()
+        connection.close()
+
+
+def run_participant(group, client, session_id, result, num_trials):
+    factory = RequestFactory()
+    version = 0
+
+    if group.mark_ready:
+        group.mark_ready(client, session_id)
+
+    for trial_num in range(1, num_trials+1):
+        # Wait for the trial to be initialized, unless the GUI client has stopped
+        while True:
+            if group.done.is_set():
+                connection.close()
+                return
+
+            response = timed_request(result, client, 'get', 'get_context', {'version': version})
+
+            if response.status_code == 200:
+                published = response.json()
+                version = published['version']
+
+                if published['context'].get('state') == 'trial:initialized' and published['context'].get('trial_num') == trial_num:
+                    break
+
+            elif response.status_code != 204:
+                connection.close()
+                return
+
+        # Submit the post-trial form. record_response is called by PyEnsemble rather than requested directly, so
+        # we call it with the participant's session attached to a request.
+        request = factory.post('/')
+        request.session = client.session
+        request.user = get_user(request)
+
+        start = time.perf_counter()
+        control.record_response(request, session_id=session_id)
+        result.record('record_response', (time.perf_counter()-start)*1000)
+
+        if group.mark_ready:
+            group.mark_ready(client, session_id)
+
+    connection.close()
+
+
+# Get a test client logged in as user, with values stored in its Django session
+def get_session_client(user, **session_values):
+    client = Client()
+    client.force_login(user)
+
+    session = client.session
+    session.update(session_values)
+    session.save()
+
+    return client
+
+
+# Mark a participant as ready for the next trial
+def mark_participant_ready(client, session_id):
+    GroupSessionSubjectSession.objects.filter(user_session_id=session_id).update(state=GroupSessionSubjectSession.States.READY)
+
+
+def default_setup(num_groups, num_participants):
+    '''
+    Create the GEM load test experiment, a user, and num_groups group sessions of num_participants participant
+    sessions each, in the load test database, and attach a GUI client and the participant clients to each group session.
+    '''
+    experiment = provision_experiment(get_gem_experiment_spec(title=LOADTEST_EXPERIMENT_TITLE))
+
+    user, created = get_user_model().objects.get_or_create(username=LOADTEST_USERNAME, defaults={'is_staff': True})
+
+    groups = []
+    for kgroup in range(0, num_groups):
+        group_session = GroupSession.objects.create(experiment=experiment)
+
+        gui = get_session_client(user, **{GROUP_SESSION_ID_KEY: group_session.pk, group_session.cache_key: {}})
+
+        participants = []
+        for kparticipant in range(0, num_participants):
+            participant_session = Session.objects.create(experiment=experiment)
+            GroupSessionSubjectSession.objects.create(group_session=group_session, user_session=participant_session)
+
+            client = get_session_client(user, **{
+                GROUP_SESSION_ID_KEY: group_session.pk,
+                experiment.cache_key: {'session_id': participant_session.pk},
+                })
+
+            participants.append((client, participant_session.pk))
+
+        groups.append(SimulatedGroup(gui, participants, mark_ready=mark_participant_ready))
+
+    return groups
+
+
+def run_load_test(setup=default_setup, num_groups=4, num_participants=GEM_SETTINGS['max_tappers'], num_trials=10, trial_duration=0, experiment_params=None, live_server=False):
+    '''
+    Simulate num_groups concurrent group sessions, each with num_participants participants, running num_trials trials.
+
+    setup is a callable(num_groups, num_participants) returning a list of SimulatedGroup objects. It is responsible for
+    creating the users, experiment, and group sessions, and for binding the clients to their group sessions. The
+    default, default_setup, creates them in the load test database.
+
+    Everything runs in a load test environment (see loadtest_environment), which is torn down afterwards. If
+    live_server is True, requests are made over HTTP to a live server thread rather than through the test client.
+
+    Returns a LoadTestResult, whose summary() gives the throughput, latency percentiles, and mean DB query count per endpoint.
+    '''
+    with loadtest_environment(live_server=live_server) as base_url:
+        return run_simulated_groups(setup, num_groups, num_participants, num_trials, trial_duration, experiment_params, base_url=base_url)
+
+
+def run_simulated_groups(setup, num_groups, num_participants, num_trials, trial_duration, experiment_params, base_url=None):
+    # By default the trial parameters come from a schedule with enough trials
+    if experiment_params is None:
+        experiment_params = {
+            'tappers_requested': num_participants,
+            'audio_feedback': GEM_SETTINGS['feedback_options'][0][0],
+            'trial_generator': 'fully_random',
+            'metronome_alpha': json.dumps([0, 0.5]),
+            'metronome_tempo': json.dumps([120]),
+            'repeats': num_trials,
+        }
+
+    groups = setup(num_groups, num_participants)
+
+    if base_url:
+        for group in groups:
+            group.gui = LiveServerClient(base_url, group.gui)
+            group.participants = [(LiveServerClient(base_url, client), session_id) for client, session_id in group.participants]
+
+    result = LoadTestResult()
+    metrics.reset()
+
+    threads = []
+    for group in groups:
+        threads.append(threading.Thread(target=run_gui, args=(group, result, num_trials, experiment_params, trial_duration)))
+
+        for client, session_id in group.participants:
+            threads.append(threading.Thread(target=run_participant, args=(group, client, session_id, result, num_trials)))
+
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    result.elapsed = time.perf_counter()-start
+    result.view_metrics = metrics.snapshot()
+
+    return result
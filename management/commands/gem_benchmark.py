@@ -0,0 +1,45 @@
+# gem_benchmark.py
+#
+# Management command for running the GEM data file reader benchmarks
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmark import run_benchmarks, append_history, read_history, find_regressions, BENCHMARK_SIZES, BENCHMARKS, DEFAULT_REGRESSION_THRESHOLD
+
+
+class Command(BaseCommand):
+    help = 'Time GEM data file reading and analysis on synthetic files, optionally tracking the results in a history file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(BENCHMARK_SIZES.keys()), default=None)
+        parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS.keys()), default=None)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--history', help='JSON-lines file to compare the results against and append them to')
+        parser.add_argument('--label', help='Label stored with the results in the history file')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD, help='Slowdown relative to the best previous median that counts as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--json', action='store_true', help='Write the results as JSON')
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(sizes=options['sizes'], benchmarks=options['benchmarks'], repeat=options['repeat'])
+
+        regressions = []
+        if options['history']:
+            regressions = find_regressions(results, read_history(options['history']), threshold=options['threshold'])
+            append_history(results, options['history'], label=options['label'])
+
+        if options['json']:
+            self.stdout.write(json.dumps({'results': results, 'regressions': regressions}, indent=2))
+        else:
+            self.stdout.write(f"{'size':<8}{'benchmark':<26}{'runs':>6}{'min ms':>10}{'median ms':>12}{'max ms':>10}")
+
+            for row in results:
+                self.stdout.write(f"{row['size']:<8}{row['benchmark']:<26}{row['nruns']:>6}{row['min_ms']:>10.2f}{row['median_ms']:>12.2f}{row['max_ms']:>10.2f}")
+
+            for row in regressions:
+                self.stderr.write(f"Regression: {row['size']} {row['benchmark']} {row['median_ms']:.2f} ms vs. {row['baseline_ms']:.2f} ms ({row['ratio']:.2f}x)")
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} benchmark(s) regressed')
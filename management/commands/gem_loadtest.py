@@ -0,0 +1,53 @@
+# gem_loadtest.py
+#
+# Management command for running the gem_control load test
+
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from ...loadtest import run_load_test
+from ...settings import GEM_SETTINGS
+
+
+class Command(BaseCommand):
+    help = 'Simulate concurrent GEM group sessions, in a test database, and report per-endpoint throughput, latency, and DB query counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--setup', default='gem_control.loadtest.default_setup', help='Dotted path of a callable(num_groups, num_participants) that returns a list of gem_control.loadtest.SimulatedGroup')
+        parser.add_argument('--groups', type=int, default=4)
+        parser.add_argument('--participants', type=int, default=GEM_SETTINGS['max_tappers'])
+        parser.add_argument('--trials', type=int, default=10)
+        parser.add_argument('--trial-duration', type=float, default=0, help='Seconds between the start and end of each trial')
+        parser.add_argument('--live-server', action='store_true', help='Make requests over HTTP to a live server thread rather than through the test client')
+        parser.add_argument('--json', action='store_true', help='Write the summary as JSON')
+        parser.add_argument('--force', action='store_true', help='Run even though DEBUG is off, e.g. on a production server')
+
+    def handle(self, *args, **options):
+        # The load test creates a test database on the configured database server and loads the site
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('DEBUG is off, which suggests a production deployment. Use --force to run the load test anyway.')
+
+        result = run_load_test(
+            import_string(options['setup']),
+            num_groups=options['groups'],
+            num_participants=options['participants'],
+            num_trials=options['trials'],
+            trial_duration=options['trial_duration'],
+            live_server=options['live_server'],
+            )
+
+        summary = result.summary()
+
+        if options['json']:
+            self.stdout.write(json.dumps({'elapsed': result.elapsed, 'endpoints': summary}, indent=2))
+            return
+
+        self.stdout.write(f"Elapsed: {result.elapsed:.2f} s")
+        self.stdout.write(f"{'endpoint':<20}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}{'errors':>8}")
+
+        for row in summary:
+            queries = f"{row['db_queries_mean']:.1f}" if row['db_queries_mean'] is not None else '-'
+            self.stdout.write(f"{row['endpoint']:<20}{row['requests']:>10}{row['throughput']:>10.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{queries:>10}{row['errors']:>8}")
@@ -0,0 +1,28 @@
+# gem_repack.py
+#
+# Management command for consolidating GEM data files into a single GEM archive
+
+from django.core.management.base import BaseCommand
+
+from ...archive import repack_files
+from ...corpus import DEFAULT_FILE_PATTERN
+
+
+class Command(BaseCommand):
+    help = 'Consolidate the GEM data files in a directory or glob pattern into a single indexed GEM archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory or glob pattern of GEM data files')
+        parser.add_argument('archive', help='Path of the archive to write')
+        parser.add_argument('--pattern', default=DEFAULT_FILE_PATTERN, help='File pattern to use if source is a directory')
+        parser.add_argument('--no-checksums', action='store_true', help='Skip computing CRC32 checksums of the window blocks')
+
+    def handle(self, *args, **options):
+        index = repack_files(options['source'], options['archive'], pattern=options['pattern'], checksums=not options['no_checksums'])
+
+        nruns = sum(len([run for run in member['runs'] if run['offset']]) for member in index['files'])
+
+        self.stdout.write(f"Wrote {len(index['files'])} files ({nruns} runs) to {options['archive']}")
+
+        for error in index['errors']:
+            self.stderr.write(f"Skipped {error['source']}: {error['error']}: {error['message']}")
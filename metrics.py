@@ -0,0 +1,217 @@
+# metrics.py
+#
+# In-process latency and wait-time instrumentation of the gem_control views. Timings are aggregated into histograms
+# with fixed bucket bounds, and each request is also logged as a structured (JSON) line.
+
+import time
+import json
+import threading
+import functools
+
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+
+from django.db import connection
+
+import logging
+logger = logging.getLogger(__name__)
+
+import pdb
+
+# Upper bounds of the histogram buckets, in milliseconds
+BUCKET_BOUNDS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000]
+
+# Names of the outcomes of interest, by status code
+OUTCOMES = {
+    200: 'ok',
+    202: 'accepted',
+    204: 'no_change',
+    400: 'bad_request',
+    410: 'gone',
+}
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKET_BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds)+1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        idx = next((idx for idx, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    # Estimate a percentile as the upper bound of the bucket in which it falls
+    def percentile(self, q):
+        if not self.count:
+            return None
+
+        target = q/100*self.count
+        cumulative = 0
+
+        for idx, count in enumerate(self.counts):
+            cumulative += count
+
+            if cumulative >= target:
+                return self.bounds[idx] if idx < len(self.bounds) else self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total/self.count if self.count else None,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': dict(zip([str(bound) for bound in self.bounds]+['inf'], self.counts)),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.outcomes = {}
+
+    def observe(self, name, view, value):
+        with self._lock:
+            self.histograms.setdefault((name, view), Histogram()).observe(value)
+
+    def count_outcome(self, view, outcome):
+        with self._lock:
+            key = (view, outcome)
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {}
+
+            for (name, view), histogram in self.histograms.items():
+                snapshot.setdefault(view, {})[name] = histogram.snapshot()
+
+            for (view, outcome), count in self.outcomes.items():
+                snapshot.setdefault(view, {}).setdefault('outcomes', {})[outcome] = count
+
+            return snapshot
+
+metrics = Metrics()
+
+
+# Accumulates the number and duration of the database queries executed on a connection
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+
+        finally:
+            self.count += 1
+            self.duration_ms += (time.perf_counter()-start)*1000
+
+
+# Time a block of code, e.g. waiting for the group to be ready, and record it under the given name
+@contextmanager
+def timed(name, view):
+    start = time.perf_counter()
+
+    try:
+        yield
+
+    finally:
+        metrics.observe(name, view, (time.perf_counter()-start)*1000)
+
+
+def get_outcome(response):
+    status = getattr(response, 'status_code', None)
+
+    if status is None:
+        return 'ok'
+
+    return OUTCOMES.get(status, str(status))
+
+
+def record_request(view, start, response, query_timer=None):
+    wall_ms = (time.perf_counter()-start)*1000
+    outcome = get_outcome(response)
+
+    metrics.observe('wall_ms', view, wall_ms)
+    metrics.count_outcome(view, outcome)
+
+    log_entry = {
+        'view': view,
+        'outcome': outcome,
+        'status': getattr(response, 'status_code', None),
+        'wall_ms': round(wall_ms, 3),
+    }
+
+    if query_timer is not None:
+        metrics.observe('db_ms', view, query_timer.duration_ms)
+        metrics.observe('db_queries', view, query_timer.count)
+
+        log_entry.update({
+            'db_queries': query_timer.count,
+            'db_ms': round(query_timer.duration_ms, 3),
+        })
+
+    logger.info(json.dumps(log_entry))
+
+
+def instrument(view_func):
+    '''
+    Decorator that records the wall time, outcome, and database query count and time of each call to a view.
+    Database queries are not tracked for async views, since they are executed on other threads.
+    '''
+    view = view_func.__name__
+
+    if iscoroutinefunction(view_func):
+        @functools.wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            start = time.perf_counter()
+
+            try:
+                response = await view_func(request, *args, **kwargs)
+
+            except Exception:
+                metrics.count_outcome(view, 'error')
+                raise
+
+            record_request(view, start, response)
+
+            return response
+
+        return async_wrapper
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        start = time.perf_counter()
+        query_timer = QueryTimer()
+
+        try:
+            with connection.execute_wrapper(query_timer):
+                response = view_func(request, *args, **kwargs)
+
+        except Exception:
+            metrics.count_outcome(view, 'error')
+            raise
+
+        record_request(view, start, response, query_timer)
+
+        return response
+
+    return wrapper
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('group', '__first__'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrialEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('trial_num', models.IntegerField(null=True)),
+                ('event', models.CharField(choices=[('experiment_init', 'Experiment Init'), ('trial_init_requested', 'Trial Init Requested'), ('group_ready', 'Group Ready'), ('trial_start', 'Trial Start'), ('trial_end', 'Trial End'), ('loop_exit', 'Loop Exit'), ('response_recorded', 'Response Recorded')], max_length=32)),
+                ('timestamp_ns', models.BigIntegerField()),
+                ('data', models.JSONField(default=dict)),
+                ('group_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gem_trial_events', to='group.groupsession')),
+            ],
+            options={
+                'ordering': ['timestamp_ns'],
+                'indexes': [models.Index(fields=['group_session', 'trial_num'], name='gem_trial_event_trial_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# models.py
+
+from django.db import models
+
+from pyensemble.group.models import GroupSession
+
+from .journal import Events
+
+# Register our system checks
+from . import checks
+
+
+class TrialEvent(models.Model):
+    '''
+    An entry in the append-only journal of group session transitions. Timestamps are wall-clock times in
+    nanoseconds since the epoch, so that events recorded by different worker processes can be compared.
+    '''
+    Events = Events
+
+    id = models.BigAutoField(primary_key=True)
+    group_session = models.ForeignKey(GroupSession, on_delete=models.CASCADE, related_name='gem_trial_events')
+    trial_num = models.IntegerField(null=True)
+    event = models.CharField(max_length=32, choices=Events.choices)
+    timestamp_ns = models.BigIntegerField()
+    data = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['timestamp_ns']
+        indexes = [
+            models.Index(fields=['group_session', 'trial_num'], name='gem_trial_event_trial_idx'),
+        ]
@@ -0,0 +1,140 @@
+# s3.py
+#
+# Ranged, coalesced access to GEM data files stored in S3
+
+import os
+import hashlib
+import bisect
+
+import pdb
+
+# Number of bytes fetched by the first request against a file. This is normally enough to cover the file header and the run offset table.
+DEFAULT_HEAD_BYTES = 64*1024
+
+# Upper bound on the size of a single coalesced request
+DEFAULT_MAX_REQUEST_BYTES = 8*1024*1024
+
+
+class S3RangeReader:
+    '''
+    Serves byte ranges of an S3 object from a small number of ranged GET requests.
+
+    Fetched ranges are held in memory and, if cache_dir is given, written to disk so that subsequent
+    readers of the same object version do not go back to S3. The fetch argument can be used to supply
+    an alternative function of (start, end) for retrieving bytes, e.g. when testing against a fake backend.
+    The size of the object is taken from s3file unless given.
+    '''
+    def __init__(self, s3file, cache_dir=None, fetch=None, size=None, head_bytes=DEFAULT_HEAD_BYTES, max_request_bytes=DEFAULT_MAX_REQUEST_BYTES):
+        self.s3file = s3file
+        self.cache_dir = cache_dir
+        self.size = size if size is not None else getattr(s3file, 'size', None)
+        self.head_bytes = head_bytes
+        self.max_request_bytes = max_request_bytes
+
+        if fetch is not None:
+            self._fetch = fetch
+
+        # Sorted list of fetched range starts, and the corresponding (start, data) chunks
+        self._starts = []
+        self._chunks = []
+
+        # Keep track of the number of requests we make
+        self.num_requests = 0
+
+        if self.cache_dir:
+            self.load_cached_ranges()
+
+    # Fetch bytes start:end from S3. The end is exclusive; an end of None reads to the end of the object.
+    def _fetch(self, start, end=None):
+        byte_range = f"bytes={start}-{end-1}" if end is not None else f"bytes={start}-"
+
+        response = self.s3file.obj.get(Range=byte_range)
+
+        return response['Body'].read()
+
+    def fetch(self, start, end=None):
+        data = self._fetch(start, end)
+        self.num_requests += 1
+
+        self.add_chunk(start, data)
+
+        if self.cache_dir:
+            with open(os.path.join(self.object_cache_dir, f"{start}-{start+len(data)}"), 'wb') as fid:
+                fid.write(data)
+
+        return data
+
+    def add_chunk(self, start, data):
+        idx = bisect.bisect_left(self._starts, start)
+        self._starts.insert(idx, start)
+        self._chunks.insert(idx, (start, data))
+
+    # Find a chunk that covers the requested range
+    def find_chunk(self, offset, nbytes):
+        idx = bisect.bisect_right(self._starts, offset)
+
+        # Walk back over chunks that start at or before the offset
+        for start, data in reversed(self._chunks[:idx]):
+            if offset + nbytes <= start + len(data):
+                return start, data
+
+        return None
+
+    def read(self, offset, nbytes):
+        chunk = self.find_chunk(offset, nbytes)
+
+        if chunk is None:
+            # Fetch at least head_bytes so that a run of small sequential reads is served from a single request
+            return self.fetch(offset, offset + max(nbytes, self.head_bytes))[:nbytes]
+
+        start, data = chunk
+
+        return data[offset-start:offset-start+nbytes]
+
+    # Fetch a list of (start, end) ranges, merging adjacent or overlapping ranges into as few requests as possible
+    def prefetch(self, ranges):
+        merged = []
+
+        for start, end in sorted(ranges, key=lambda r: r[0]):
+            # Skip anything we already have
+            if end is not None and self.find_chunk(start, end-start):
+                continue
+
+            if merged:
+                prev_start, prev_end = merged[-1]
+
+                if prev_end is not None and start <= prev_end and (end is None or end-prev_start <= self.max_request_bytes):
+                    merged[-1] = (prev_start, end if end is None else max(prev_end, end))
+                    continue
+
+            merged.append((start, end))
+
+        for start, end in merged:
+            self.fetch(start, end)
+
+        return merged
+
+    #
+    # Local caching of fetched ranges
+    #
+
+    @property
+    def cache_key(self):
+        obj = self.s3file.obj
+
+        # The ETag changes whenever the object is rewritten, so cached ranges are never served for a stale version
+        return hashlib.sha1(f"{obj.bucket_name}/{obj.key}/{obj.e_tag}".encode()).hexdigest()
+
+    @property
+    def object_cache_dir(self):
+        path = os.path.join(self.cache_dir, self.cache_key)
+        os.makedirs(path, exist_ok=True)
+
+        return path
+
+    def load_cached_ranges(self):
+        for fname in os.listdir(self.object_cache_dir):
+            start, end = [int(v) for v in fname.split('-')]
+
+            with open(os.path.join(self.object_cache_dir, fname), 'rb') as fid:
+                self.add_chunk(start, fid.read())
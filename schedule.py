@@ -0,0 +1,111 @@
+# schedule.py
+#
+# Methods for generating the full list of trials for an experiment when it is initialized. A schedule is stored
+# compactly as the list of unique trial conditions and the order in which they are presented.
+
+import json
+import random
+
+from django.utils.module_loading import import_string
+
+from .settings import GEM_SETTINGS
+
+import pdb
+
+
+# Present each combination of metronome alpha and tempo the requested number of times, in a random order
+def fully_random(params):
+    tempos = params['metronome_tempo']
+    if not isinstance(tempos, (list, tuple)):
+        tempos = [tempos]
+
+    conditions = [{'metronome_alpha': alpha, 'metronome_tempo': tempo} for alpha in params['metronome_alpha'] for tempo in tempos]
+
+    order = list(range(0, len(conditions)))*params['repeats']
+    random.Random(params.get('seed')).shuffle(order)
+
+    return conditions, order
+
+fully_random.required_params = ['metronome_alpha', 'metronome_tempo', 'repeats']
+
+GENERATORS = {
+    'fully_random': fully_random,
+}
+
+
+# Get the function for the named trial generator: either one of the built-in generators or one of the dotted paths
+# listed in GEM_SETTINGS['trial_generators']. Raises ValueError for any other name, or ImportError if a listed
+# generator can't be imported.
+def get_generator(name):
+    if name in GENERATORS:
+        return GENERATORS[name]
+
+    if name not in GEM_SETTINGS['trial_generators']:
+        raise ValueError(f"Unknown trial generator: {name}")
+
+    return import_string(name)
+
+
+# Reduce a list of per-trial parameter dicts to the unique conditions and the order in which they occur
+def compact_trials(trials):
+    conditions = []
+    condition_idxs = {}
+    order = []
+
+    for trial in trials:
+        key = json.dumps(trial, sort_keys=True)
+
+        if key not in condition_idxs:
+            condition_idxs[key] = len(conditions)
+            conditions.append(trial)
+
+        order.append(condition_idxs[key])
+
+    return conditions, order
+
+
+def generate_schedule(params):
+    '''
+    Expand the trial generator named in params into the full trial schedule. The generator is either a keyword,
+    e.g. 'fully_random', or one of the dotted paths listed in GEM_SETTINGS['trial_generators'] of a function that
+    takes the experiment parameters and returns either a list of per-trial parameter dicts or a (conditions, order)
+    tuple. Generators can list the parameters they need in a required_params attribute.
+
+    Returns None if the parameters needed by the generator haven't been provided.
+    '''
+    generator = params.get('trial_generator') or 'fully_random'
+
+    generator_func = get_generator(generator)
+
+    if any(params.get(name) is None for name in getattr(generator_func, 'required_params', [])):
+        return None
+
+    trials = generator_func(params)
+
+    if isinstance(trials, tuple):
+        conditions, order = trials
+    else:
+        conditions, order = compact_trials(trials)
+
+    return {
+        'generator': generator,
+        'conditions': conditions,
+        'order': order,
+    }
+
+
+def get_num_trials(schedule):
+    return len(schedule['order'])
+
+# Get the parameters for a trial. Trial numbers start at 1.
+def get_trial_params(schedule, trial_num):
+    if trial_num < 1 or trial_num > get_num_trials(schedule):
+        return None
+
+    return schedule['conditions'][schedule['order'][trial_num-1]]
+
+# Get the parameters of up to count trials, starting at trial_num
+def get_upcoming_trials(schedule, trial_num, count):
+    last_trial_num = min(trial_num+count-1, get_num_trials(schedule))
+
+    return [{'trial_num': num, 'params': get_trial_params(schedule, num)} for num in range(trial_num, last_trial_num+1)]
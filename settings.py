@@ -10,4 +10,7 @@ GEM_SETTINGS = {
         ("hear_metronome_and_self", "Hear Metronome and Self"),
         ("hear_all", "Hear All"),
     ],
-}
\ No newline at end of file
+
+    # Dotted paths of the functions, besides the built-in generators, that may be named as an experiment's trial_generator
+    'trial_generators': [],
+}
@@ -0,0 +1,101 @@
+# stats.py
+#
+# Vectorized statistics over stacked GEM run data. These mirror the calculations performed by GEMRun.compute_stats,
+# but operate on all runs of a file at once.
+
+import warnings
+
+import numpy as np
+
+import pdb
+
+
+# NaN-aware count, mean, and sample standard deviation (ddof=1) along an axis, matching pandas' skipna behavior
+def nan_count_mean_std(x, axis):
+    valid = ~np.isnan(x)
+    count = valid.sum(axis=axis)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+
+        mean = np.nansum(x, axis=axis)/count
+        resid = np.where(valid, x - np.expand_dims(mean, axis), 0)
+        std = np.sqrt((resid**2).sum(axis=axis)/(count-1))
+
+    mean = np.where(count > 0, mean, np.nan)
+    std = np.where(count > 1, std, np.nan)
+
+    return count, mean, std
+
+
+def compute_run_stats(asynchronies, next_met_adjust, num_pacing_clicks=0):
+    '''
+    Compute the GEMRun.compute_stats statistics for a stack of runs.
+
+    asynchronies is a (runs x windows x tappers) float array with missing values set to NaN, containing only the valid tappers.
+    next_met_adjust is a (runs x windows) array.
+
+    Returns a dict of arrays. Per-window statistics are (runs x windows), per-tapper statistics are (runs x tappers), and
+    metronome and group statistics are (runs,).
+    '''
+    stats = {}
+
+    #
+    # Per-window statistics
+    #
+
+    _, mean_tapper_asynchrony, std_tapper_asynchrony = nan_count_mean_std(asynchronies, axis=2)
+    stats['mean_tapper_asynchrony'] = mean_tapper_asynchrony
+    stats['std_tapper_asynchrony'] = std_tapper_asynchrony
+
+    # Tapper asynchronies relative to the group mean asynchrony
+    asynchrony_rel_group = asynchronies - mean_tapper_asynchrony[:, :, np.newaxis]
+
+    # Exclude the pacing clicks from the per-run statistics
+    asynchronies = asynchronies[:, num_pacing_clicks:, :]
+    asynchrony_rel_group = asynchrony_rel_group[:, num_pacing_clicks:, :]
+
+    #
+    # Per-tapper statistics
+    #
+
+    count, stats['mean_async_rel_met'], stats['std_async_rel_met'] = nan_count_mean_std(asynchronies, axis=1)
+    stats['num_missed'] = asynchronies.shape[1] - count
+
+    _, stats['mean_async_rel_grp'], stats['std_async_rel_grp'] = nan_count_mean_std(asynchrony_rel_group, axis=1)
+
+    #
+    # Metronome statistics
+    #
+
+    _, stats['met_adjust_mean'], stats['met_adjust_std'] = nan_count_mean_std(next_met_adjust[:, num_pacing_clicks:].astype(float), axis=1)
+
+    #
+    # Group statistics. Note that these include the pacing clicks.
+    #
+
+    _, stats['mean_grp_mean_asynch_per_window'], stats['std_grp_mean_asynch_per_window'] = nan_count_mean_std(mean_tapper_asynchrony, axis=1)
+    _, stats['mean_grp_std_asynch_per_window'], stats['std_grp_std_asynch_per_window'] = nan_count_mean_std(std_tapper_asynchrony, axis=1)
+
+    return stats
+
+
+# Compare each window's metronome time against the time expected from the preceding window. The expected time is the
+# previous metronome time plus one beat at the run's tempo plus the previous window's metronome adjustment.
+#
+# met_time and next_met_adjust are (runs x windows) arrays and tempo is a (runs,) array. Returns a (runs x windows)
+# array of time differences, with the first window of each run set to zero since there is nothing to compare it to.
+def metronome_time_differences(met_time, next_met_adjust, tempo):
+    msec_per_tick = 1/np.asarray(tempo, dtype=float)*60*1000
+
+    expected_met_time = met_time[:, :-1] + msec_per_tick[:, np.newaxis] + next_met_adjust[:, :-1]
+
+    time_differences = np.zeros(met_time.shape)
+    time_differences[:, 1:] = met_time[:, 1:] - expected_met_time
+
+    return time_differences
+
+
+TAPPER_STATS = ['num_missed', 'mean_async_rel_met', 'std_async_rel_met', 'mean_async_rel_grp', 'std_async_rel_grp']
+METRONOME_STATS = ['met_adjust_mean', 'met_adjust_std']
+GROUP_STATS = ['mean_grp_mean_asynch_per_window', 'std_grp_mean_asynch_per_window', 'mean_grp_std_asynch_per_window', 'std_grp_std_asynch_per_window']
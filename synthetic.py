@@ -0,0 +1,145 @@
+# synthetic.py
+#
+# Writer of synthetic GEM data files, laid out as GEM writes them and GEMDataFileReader reads them: a uint64 length
+# followed by the JSON file header, the table of uint64 run offsets, and for each run a uint64 length followed by the
+# JSON run header and the packed window records. Useful for testing and benchmarking without the GEM hardware.
+
+import json
+import itertools
+
+import numpy as np
+
+from .file import GEM_MAX_TAPPERS, GEM_WINDOW_DTYPE, MISSING_DATA_VALUE
+
+import pdb
+
+
+def pack_header(hdr):
+    hdr_bytes = json.dumps(hdr).encode()
+
+    return np.uint64(len(hdr_bytes)).tobytes() + hdr_bytes
+
+
+# Simulate the asynchronies of tappers who correct a fraction phase_correction of their asynchrony on each tap, along
+# with the adjustments of a metronome that moves by a fraction metronome_alpha of the mean asynchrony. This is the
+# linear phase correction model that analysis.estimate_adaptive_timing fits.
+def simulate_adaptive_timing(rng, nwindows, ntappers, phase_correction, metronome_alpha, asynchrony_sd=30.0):
+    taps = np.zeros((nwindows, ntappers))
+    adjustments = np.zeros(nwindows, dtype=int)
+
+    asynchrony = np.round(rng.normal(0, asynchrony_sd, size=ntappers))
+
+    for kwindow in range(0, nwindows):
+        taps[kwindow] = asynchrony
+        adjustments[kwindow] = np.round(metronome_alpha*asynchrony.mean())
+
+        asynchrony = np.round(asynchrony - phase_correction*asynchrony - adjustments[kwindow] + rng.normal(0, asynchrony_sd, size=ntappers))
+
+    return taps, adjustments
+
+
+def make_run_windows(rng, nwindows, tempo, tapper_idxs, missing_rate=0.0, asynchrony_sd=30.0, max_adjust=20, start_time=1000, phase_correction=None, metronome_alpha=0):
+    '''
+    Generate the windows of a single run. Asynchronies are drawn from a normal distribution, with each tap missing
+    with probability missing_rate, and metronome adjustments are drawn uniformly from [-max_adjust, max_adjust].
+    If phase_correction is given, the asynchronies and adjustments are instead simulated with
+    simulate_adaptive_timing, using the run's metronome_alpha. The metronome times follow from the tempo and the
+    adjustments, as GEMRun.verify_metronome_values expects.
+    '''
+    windows = np.zeros(nwindows, dtype=GEM_WINDOW_DTYPE)
+
+    windows['dtp_id'] = ord('D')
+    windows['window_num'] = np.arange(1, nwindows+1)
+
+    # Unused pads are always missing
+    asynchronies = np.full((nwindows, GEM_MAX_TAPPERS), MISSING_DATA_VALUE, dtype='<i2')
+
+    if phase_correction is None:
+        taps = np.round(rng.normal(0, asynchrony_sd, size=(nwindows, len(tapper_idxs))))
+    else:
+        taps, adjustments = simulate_adaptive_timing(rng, nwindows, len(tapper_idxs), phase_correction, metronome_alpha, asynchrony_sd=asynchrony_sd)
+
+    taps[rng.random(taps.shape) < missing_rate] = MISSING_DATA_VALUE
+    asynchronies[:, tapper_idxs] = taps
+
+    windows['asynchronies'] = asynchronies
+
+    if phase_correction is None:
+        adjustments = rng.integers(-max_adjust, max_adjust+1, size=nwindows)
+
+    windows['next_met_adjust'] = adjustments
+
+    # Each metronome time is the previous one plus one beat plus the previous window's adjustment
+    msec_per_tick = 1/tempo*60*1000
+    intervals = np.concatenate([[0], msec_per_tick + adjustments[:-1]])
+    windows['met_time'] = np.round(start_time + np.cumsum(intervals))
+
+    return windows
+
+
+def write_gem_file(filepath, metronome_alpha=[0, 0.25, 0.5, 0.75, 1], metronome_tempo=[120.0], repeats=2, windows=26,
+    num_tappers=2, missing_rate=0.0, asynchrony_sd=30.0, max_adjust=20, missing_runs=[], audio_feedback='hear_metronome', seed=None,
+    phase_correction=None):
+    '''
+    Write a synthetic GEM data file with one run per combination of metronome alpha, tempo, and repeat.
+
+    By default the asynchronies and metronome adjustments are independent random values. If phase_correction is
+    given, the tappers correct that fraction of their asynchrony on each tap, and the metronome adapts with each
+    run's alpha, as in the linear phase correction model.
+
+    Runs listed (by index) in missing_runs are left out, with a zero offset, as for runs that were never recorded.
+    Tempos that don't correspond to a whole number of milliseconds per beat yield rounded metronome times, which fail
+    the metronome checks, as would a misbehaving metronome.
+
+    Returns the file header.
+    '''
+    rng = np.random.default_rng(seed)
+
+    tapper_idxs = list(range(0, num_tappers))
+
+    file_hdr = {
+        'metronome_alpha': list(metronome_alpha),
+        'metronome_tempo': list(metronome_tempo),
+        'repeats': repeats,
+        'windows': windows,
+        'audio_feedback': [audio_feedback],
+        'subject_info': [{'id': f'S{idx+1:03d}', 'pad': idx+1} for idx in tapper_idxs],
+    }
+
+    conditions = [(alpha, tempo) for alpha, tempo, _ in itertools.product(metronome_alpha, metronome_tempo, range(0, repeats))]
+    nruns = len(conditions)
+
+    hdr_bytes = pack_header(file_hdr)
+    idx_map_offset = len(hdr_bytes)
+
+    run_offsets = np.zeros(nruns, dtype='<u8')
+    offset = idx_map_offset + run_offsets.nbytes
+
+    with open(filepath, 'wb') as fid:
+        fid.write(hdr_bytes)
+
+        # Reserve space for the run offsets, which are filled in once the runs have been written
+        fid.write(run_offsets.tobytes())
+
+        for krun, (alpha, tempo) in enumerate(conditions):
+            if krun in missing_runs:
+                continue
+
+            run_hdr = {
+                'run_number': krun+1,
+                'metronome_alpha': alpha,
+                'tempo': tempo,
+                'audio_feedback': audio_feedback,
+            }
+
+            run_bytes = pack_header(run_hdr) + make_run_windows(rng, windows, tempo, tapper_idxs, missing_rate=missing_rate, asynchrony_sd=asynchrony_sd, max_adjust=max_adjust,
+                phase_correction=phase_correction, metronome_alpha=alpha).tobytes()
+
+            run_offsets[krun] = offset
+            fid.write(run_bytes)
+            offset += len(run_bytes)
+
+        fid.seek(idx_map_offset, 0)
+        fid.write(run_offsets.tobytes())
+
+    return file_hdr
@@ -0,0 +1,38 @@
+# test_analysis.py
+#
+# The adaptive timing analysis must recover the phase correction and metronome alpha that synthetic runs were made with
+
+import numpy as np
+
+from ..analysis import analyze_reader
+from ..file import GEMDataFileReader
+from .util import SyntheticFileTestCase
+
+
+class AdaptiveTimingTest(SyntheticFileTestCase):
+    def analyze(self, **kwargs):
+        filepath = self.write_file('analysis.gdf', metronome_alpha=[0, 0.25, 0.5], repeats=4, windows=200, num_tappers=3, asynchrony_sd=10.0, **kwargs)
+
+        return analyze_reader(GEMDataFileReader(filepath, lazy=True))
+
+    def test_recovers_alphas(self):
+        analysis = self.analyze(phase_correction=0.4)
+
+        self.assertAlmostEqual(analysis['phase_correction'].mean(), 0.4, delta=0.05)
+
+        for alpha, runs in analysis.groupby('metronome_alpha'):
+            self.assertAlmostEqual(runs['metronome_gain'].mean(), alpha, delta=0.05)
+
+    # Pairs with a missing tap are left out, which doesn't bias the phase correction
+    def test_missing_taps(self):
+        analysis = self.analyze(phase_correction=0.4, missing_rate=0.1)
+
+        self.assertTrue(np.all(analysis['phase_correction_n'] < 199))
+        self.assertAlmostEqual(analysis['phase_correction'].mean(), 0.4, delta=0.05)
+
+    def test_uncorrelated_runs(self):
+        analysis = self.analyze()
+
+        # Independent random asynchronies regress to the mean, so their change is the negative of the asynchrony
+        self.assertAlmostEqual(analysis['phase_correction'].mean(), 1, delta=0.1)
+        self.assertAlmostEqual(analysis['lag1_autocorr'].mean(), 0, delta=0.1)
@@ -0,0 +1,59 @@
+# test_archive.py
+#
+# Repacking GEM data files into an archive must preserve their runs, and must not be derailed by unreadable files
+
+import os
+
+import numpy as np
+
+from ..archive import GEMArchive, repack_files
+from ..file import GEMDataFileReader
+from .util import SyntheticFileTestCase
+
+
+class RepackTest(SyntheticFileTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.paths = [self.write_file(f'session{kfile}.gdf', seed=kfile, num_tappers=2, missing_runs=[1]) for kfile in range(0, 2)]
+
+        self.archive_path = os.path.join(self.tmpdir.name, 'sessions.gemarc')
+
+    def check_members(self, paths):
+        with GEMArchive(self.archive_path) as archive:
+            self.assertEqual(archive.names, [os.path.basename(path) for path in paths])
+
+            for path in paths:
+                reader = GEMDataFileReader(path, lazy=True)
+                member = archive.get_reader(os.path.basename(path), lazy=True)
+
+                self.assertEqual(member.file_hdr, reader.file_hdr)
+                self.assertEqual(member.nruns, reader.nruns)
+
+                for run, member_run in zip(reader.run_info, member.run_info):
+                    self.assertEqual(member_run.hdr, run.hdr)
+
+                    if run.windows is None:
+                        self.assertIsNone(member_run.windows)
+                        continue
+
+                    for name in run.windows.dtype.names:
+                        self.assertTrue(np.array_equal(member_run.windows[name], run.windows[name]))
+
+    def test_roundtrip(self):
+        index = repack_files(self.paths, self.archive_path)
+
+        self.assertEqual(index['errors'], [])
+        self.check_members(self.paths)
+
+    def test_unreadable_file(self):
+        corrupt_path = os.path.join(self.tmpdir.name, 'corrupt.gdf')
+        with open(corrupt_path, 'wb') as fid:
+            fid.write(b'\xff'*64)
+
+        index = repack_files([self.paths[0], corrupt_path, self.paths[1]], self.archive_path)
+
+        self.assertEqual([error['name'] for error in index['errors']], ['corrupt.gdf'])
+        self.check_members(self.paths)
+
+        self.assertFalse(any('.tmp-' in name for name in os.listdir(self.tmpdir.name)))
@@ -0,0 +1,69 @@
+# test_cache.py
+#
+# The columnar cache must reproduce the decoded file, and must not serve the contents of a file that has since changed
+
+import io
+import os
+
+from contextlib import redirect_stdout
+from unittest import mock
+
+import numpy as np
+
+from .. import file as gem_file
+from ..cache import read_cache
+from ..file import GEMDataFileReader
+from .util import SyntheticFileTestCase
+
+
+class ColumnarCacheTest(SyntheticFileTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.filepath = self.write_file('cached.gdf', num_tappers=3, missing_runs=[1])
+        self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+
+    def read(self, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return GEMDataFileReader(self.filepath, **kwargs)
+
+    def check_runs(self, reader, expected):
+        self.assertEqual(reader.file_hdr, expected.file_hdr)
+        self.assertEqual(reader.run_offsets, expected.run_offsets)
+
+        for run, expected_run in zip(reader.run_info, expected.run_info):
+            self.assertEqual(run.hdr, expected_run.hdr)
+
+            if expected_run.windows is None:
+                self.assertIsNone(run.windows)
+            else:
+                self.assertTrue(np.array_equal(run.windows, expected_run.windows))
+
+    def test_roundtrip(self):
+        self.read(columnar_cache=self.cache_dir)
+        self.assertIsNotNone(read_cache(self.filepath, self.cache_dir))
+
+        # The second reader is populated from the cache, without parsing the file
+        with mock.patch.object(gem_file.GEMDataFileReader, 'read_file_header') as read_file_header:
+            cached = self.read(columnar_cache=self.cache_dir)
+
+        read_file_header.assert_not_called()
+        self.check_runs(cached, self.read())
+
+    def test_stale_cache(self):
+        self.read(columnar_cache=self.cache_dir)
+
+        # Rewrite the file with different data of the same size, with a later modification time
+        info = os.stat(self.filepath)
+        self.write_file('cached.gdf', seed=1, num_tappers=3, missing_runs=[1])
+        os.utime(self.filepath, ns=(info.st_atime_ns, info.st_mtime_ns+10**9))
+
+        self.assertEqual(os.path.getsize(self.filepath), info.st_size)
+        self.assertIsNone(read_cache(self.filepath, self.cache_dir))
+
+        reader = self.read(columnar_cache=self.cache_dir)
+        self.check_runs(reader, self.read())
+
+        # The cache was replaced with the new contents
+        self.check_runs(self.read(columnar_cache=self.cache_dir), self.read())
+        self.assertIsNotNone(read_cache(self.filepath, self.cache_dir))
@@ -0,0 +1,67 @@
+# test_catalog.py
+#
+# The catalog must only re-read changed files, and must find runs by condition without decoding other runs
+
+import os
+
+import numpy as np
+
+from ..catalog import GEMCatalog
+from ..file import GEMDataFileReader
+from .util import SyntheticFileTestCase
+
+
+class CatalogTest(SyntheticFileTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.datadir = os.path.join(self.tmpdir.name, 'data')
+        os.mkdir(self.datadir)
+
+        self.paths = [self.write_file(os.path.join('data', f'session{kfile}.gdf'), seed=kfile, num_tappers=kfile+2, missing_runs=[1]) for kfile in range(0, 2)]
+
+        self.catalog = GEMCatalog(os.path.join(self.tmpdir.name, 'catalog.sqlite'))
+        self.addCleanup(self.catalog.close)
+
+    def test_incremental_update(self):
+        summary = self.catalog.update(self.datadir)
+        self.assertEqual(sorted(summary['added']), sorted(self.paths))
+        self.assertEqual(summary['errors'], [])
+
+        summary = self.catalog.update(self.datadir)
+        self.assertEqual(sorted(summary['unchanged']), sorted(self.paths))
+        self.assertEqual(summary['added'] + summary['updated'], [])
+
+        # Rewrite one file with different conditions, and remove the other
+        self.write_file(os.path.join('data', 'session0.gdf'), metronome_alpha=[0.5], num_tappers=2)
+        os.remove(self.paths[1])
+
+        summary = self.catalog.update(self.datadir)
+        self.assertEqual(summary['updated'], [self.paths[0]])
+        self.assertEqual(summary['removed'], [self.paths[1]])
+
+        self.assertEqual(list(self.catalog.get_file_headers().keys()), [self.paths[0]])
+        self.assertEqual({run.hdr['metronome_alpha'] for run in self.catalog.query()}, {0.5})
+
+    def test_query(self):
+        self.catalog.update(self.datadir)
+
+        runs = self.catalog.query(metronome_alpha=[0.25, 0.5], num_tappers=2)
+
+        self.assertEqual({run.path for run in runs}, {self.paths[0]})
+        self.assertEqual({run.hdr['metronome_alpha'] for run in runs}, {0.25, 0.5})
+
+        reader = GEMDataFileReader(self.paths[0], lazy=True)
+
+        for run in runs:
+            windows = reader.run_info[run.krun].windows
+            self.assertTrue(np.array_equal(run.load_windows(), windows))
+
+    def test_missing_runs(self):
+        self.catalog.update(self.datadir)
+
+        self.assertNotIn(1, [run.krun for run in self.catalog.query(subject_id='S001')])
+        self.assertIn(1, [run.krun for run in self.catalog.query(subject_id='S001', include_missing=True)])
+
+        self.assertEqual(len(self.catalog.query(subject_id='S004')), 0)
+        self.assertEqual({run.path for run in self.catalog.query(subject_id='S003')}, {self.paths[1]})
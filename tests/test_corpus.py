@@ -0,0 +1,61 @@
+# test_corpus.py
+#
+# Loading a corpus must produce the same statistics as reading each file, whether or not the files are loaded in
+# parallel, and must report unreadable files without aborting
+
+import io
+import os
+
+from contextlib import redirect_stdout
+
+from ..corpus import load_corpus
+from ..file import GEMDataFileReader
+from .util import SyntheticFileTestCase, assert_stats_equal
+
+
+class LoadCorpusTest(SyntheticFileTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.paths = [self.write_file(f'session{kfile}.gdf', seed=kfile, num_tappers=kfile+2, missing_runs=[3]) for kfile in range(0, 2)]
+
+        self.corrupt_path = os.path.join(self.tmpdir.name, 'corrupt.gdf')
+        with open(self.corrupt_path, 'wb') as fid:
+            fid.write(b'\xff'*64)
+
+    def check_corpus(self, corpus):
+        self.assertEqual(list(corpus.errors['file']), [self.corrupt_path])
+
+        for path in self.paths:
+            with redirect_stdout(io.StringIO()):
+                reader = GEMDataFileReader(path)
+                reader.compute_stats()
+
+            file_windows = corpus.windows[corpus.windows['file'] == path]
+            file_tapper_stats = corpus.tapper_stats[corpus.tapper_stats['file'] == path]
+            file_run_stats = corpus.run_stats[corpus.run_stats['file'] == path]
+
+            runs = [run for run in reader.run_info if run.windows is not None]
+            ntappers = len(reader.get_valid_tapper_ids())
+
+            self.assertEqual(len(file_windows), len(runs)*reader.file_hdr['windows']*ntappers)
+            self.assertEqual(list(file_run_stats['run_number']), [run.hdr['run_number'] for run in runs])
+
+            for run in runs:
+                for tapper_id, stats in run.tapper_stats.items():
+                    row = file_tapper_stats[(file_tapper_stats['run_number'] == run.hdr['run_number']) & (file_tapper_stats['tapper_id'] == tapper_id)]
+                    self.assertEqual(len(row), 1)
+
+                    assert_stats_equal(self, {key: row.iloc[0][key] for key in stats}, stats)
+
+    def test_serial(self):
+        self.check_corpus(load_corpus(self.tmpdir.name, processes=0))
+
+    def test_parallel(self):
+        self.check_corpus(load_corpus(self.tmpdir.name, processes=2))
+
+    def test_paths(self):
+        corpus = load_corpus(self.paths[:1], processes=0)
+
+        self.assertEqual(set(corpus.run_stats['file']), {self.paths[0]})
+        self.assertTrue(corpus.errors.empty)
@@ -0,0 +1,42 @@
+# test_create.py
+#
+# Provisioning the test experiment must be idempotent, and must reject bad parameters
+
+from django.test import TestCase, RequestFactory
+
+from pyensemble.models import Experiment, ExperimentXForm
+
+from ..create import create_test_experiment
+
+
+class CreateTestExperimentTest(TestCase):
+    def create(self, **params):
+        return create_test_experiment(RequestFactory().get('/create/experiment/', params))
+
+    def get_form_sequence(self):
+        return list(ExperimentXForm.objects.filter(experiment__title='GEM Test').order_by('form_order').values('pk', 'form_order', 'goto', 'repeat'))
+
+    def test_idempotent(self):
+        self.assertEqual(self.create(repeats=5).status_code, 200)
+        sequence = self.get_form_sequence()
+
+        self.assertEqual(self.create(repeats=5).status_code, 200)
+
+        self.assertEqual(Experiment.objects.filter(title='GEM Test').count(), 1)
+        self.assertEqual(self.get_form_sequence(), sequence)
+
+    def test_update_in_place(self):
+        self.create(repeats=5)
+        sequence = self.get_form_sequence()
+
+        self.create(repeats=8)
+        updated = self.get_form_sequence()
+
+        self.assertEqual([exf['pk'] for exf in updated], [exf['pk'] for exf in sequence])
+        self.assertEqual([exf['repeat'] for exf in updated], [None, 8, None])
+
+    def test_invalid_repeats(self):
+        for repeats in ['x', '0', '-1']:
+            self.assertEqual(self.create(repeats=repeats).status_code, 400)
+
+        self.assertFalse(Experiment.objects.exists())
@@ -0,0 +1,84 @@
+# test_follow.py
+#
+# Following a file while it is being written must yield each run once its data are complete, with the same data as
+# reading the finished file
+
+import os
+import time
+import threading
+
+import numpy as np
+
+from ..file import GEMDataFileReader
+from ..follow import follow_file
+from .util import SyntheticFileTestCase
+
+# Seconds between the writes to the growing file
+WRITE_DELAY = 0.02
+
+
+class FollowFileTest(SyntheticFileTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.source_path = self.write_file('source.gdf', metronome_alpha=[0, 0.5], repeats=2, num_tappers=2, missing_runs=[2])
+        self.growing_path = os.path.join(self.tmpdir.name, 'growing.gdf')
+
+        self.source = GEMDataFileReader(self.source_path, lazy=True)
+        self.source.read_file_header()
+
+    # Write the source file to the growing file piece by piece, in the order GEM writes it: the file header, the
+    # empty run offset table, and each run, with its offset filled in before its data have all been written
+    def write_growing_file(self):
+        with open(self.source_path, 'rb') as fid:
+            data = fid.read()
+
+        table_offset = self.source.idx_map_offset
+        offsets = [offset for offset in self.source.run_offsets if offset] + [len(data)]
+
+        def write(fid, start, end):
+            fid.write(data[start:end])
+            fid.flush()
+            time.sleep(WRITE_DELAY)
+
+        with open(self.growing_path, 'wb') as fid:
+            write(fid, 0, table_offset)
+            fid.write(bytes(8*self.source.nruns))
+
+            for krun, run_offset in enumerate(self.source.run_offsets):
+                if not run_offset:
+                    continue
+
+                fid.seek(table_offset+8*krun)
+                write(fid, table_offset+8*krun, table_offset+8*(krun+1))
+
+                fid.seek(run_offset)
+                run_end = offsets[offsets.index(run_offset)+1]
+                write(fid, run_offset, (run_offset+run_end)//2)
+                write(fid, (run_offset+run_end)//2, run_end)
+
+    def test_growing_file(self):
+        writer = threading.Thread(target=self.write_growing_file)
+        writer.start()
+        self.addCleanup(writer.join)
+
+        # The missing run is never completed, so following stops at the timeout
+        runs = list(follow_file(self.growing_path, poll_interval=WRITE_DELAY/4, timeout=0.5))
+
+        self.assertEqual([run.krun for run in runs], [0, 1, 3])
+
+        for run in runs:
+            self.assertEqual(run.hdr, self.source.run_info[run.krun].hdr)
+            self.assertTrue(np.array_equal(run.windows, self.source.run_info[run.krun].windows))
+            self.assertTrue(run.tapper_stats)
+
+    def test_timeout(self):
+        # Only the file header has been written, so the run offset table is incomplete
+        with open(self.source_path, 'rb') as fid:
+            header = fid.read(self.source.idx_map_offset)
+
+        with open(self.growing_path, 'wb') as fid:
+            fid.write(header)
+
+        with self.assertRaises(ValueError):
+            list(follow_file(self.growing_path, poll_interval=0.01, timeout=0.05))
@@ -0,0 +1,45 @@
+# test_forms.py
+#
+# The experiment initialization form must reject trial generator parameters that the generator can't use
+
+import json
+
+from django.test import SimpleTestCase
+
+from ..forms import ExperimentInitForm
+from ..schedule import generate_schedule
+
+
+class ExperimentInitFormTest(SimpleTestCase):
+    def get_form(self, **data):
+        data = {'tappers_requested': 2, 'audio_feedback': ExperimentInitForm.base_fields['audio_feedback'].choices[0][0], 'trial_generator': 'fully_random', **data}
+
+        return ExperimentInitForm(data)
+
+    def test_scalar_alpha(self):
+        form = self.get_form(metronome_alpha='0.25', metronome_tempo='120', repeats=2)
+
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['metronome_alpha'], [0.25])
+
+        schedule = generate_schedule(form.cleaned_data)
+        self.assertEqual(len(schedule['order']), 2)
+
+    def test_no_schedule_params(self):
+        form = self.get_form()
+
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIsNone(generate_schedule(form.cleaned_data))
+
+    def test_invalid_params(self):
+        for alpha in [json.dumps([]), json.dumps(['x']), json.dumps([True]), json.dumps({'alpha': 1}), '"x"']:
+            form = self.get_form(metronome_alpha=alpha, metronome_tempo='120', repeats=2)
+
+            self.assertFalse(form.is_valid(), alpha)
+            self.assertIn('metronome_alpha', form.errors)
+
+    def test_missing_params(self):
+        form = self.get_form(metronome_alpha=json.dumps([0, 0.5]))
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(set(form.errors.keys()), {'metronome_tempo', 'repeats'})
@@ -0,0 +1,63 @@
+# test_journal.py
+#
+# Buffered trial events must reach the database at trial boundaries, and after a while even without one
+
+import time
+
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import journal
+from ..journal import EventJournal, Events
+
+
+class FakeEvent:
+    objects = None
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class EventJournalTest(SimpleTestCase):
+    def setUp(self):
+        FakeEvent.objects = mock.Mock()
+
+        patcher = mock.patch.object(journal, 'get_event_model', return_value=FakeEvent)
+        self.get_event_model = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_flushed(self):
+        return [event.event for call in FakeEvent.objects.bulk_create.call_args_list for event in call.args[0]]
+
+    def test_flush_at_trial_boundary(self):
+        event_journal = EventJournal(flush_age=60)
+        self.addCleanup(event_journal.flush)
+
+        event_journal.record(1, Events.TRIAL_INIT_REQUESTED, trial_num=1)
+        event_journal.record(1, Events.GROUP_READY, trial_num=1)
+        self.assertEqual(self.get_flushed(), [])
+
+        event_journal.record(1, Events.TRIAL_START, trial_num=1)
+        self.assertEqual(self.get_flushed(), [Events.TRIAL_INIT_REQUESTED, Events.GROUP_READY, Events.TRIAL_START])
+
+    def test_flush_on_timer(self):
+        event_journal = EventJournal(flush_age=0.05)
+
+        with mock.patch.object(journal, 'connections'):
+            event_journal.record(1, Events.RESPONSE_RECORDED, trial_num=1)
+
+            deadline = time.monotonic() + 2
+            while not self.get_flushed() and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual(self.get_flushed(), [Events.RESPONSE_RECORDED])
+
+    def test_not_installed(self):
+        self.get_event_model.return_value = None
+        event_journal = EventJournal()
+
+        with self.assertLogs(journal.logger, 'WARNING'):
+            event_journal.record(1, Events.TRIAL_END, trial_num=1)
+
+        self.assertEqual(event_journal.flush(), 0)
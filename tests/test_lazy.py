@@ -0,0 +1,52 @@
+# test_lazy.py
+#
+# Lazily opened readers must read the same data as eagerly opened ones, without holding their files open
+
+import io
+
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from ..file import GEMDataFileReader
+from .util import SyntheticFileTestCase
+
+
+class LazyReaderTest(SyntheticFileTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.filepath = self.write_file('lazy.gdf', num_tappers=3, missing_runs=[2])
+
+    def test_matches_eager_read(self):
+        with redirect_stdout(io.StringIO()):
+            eager = GEMDataFileReader(self.filepath)
+
+        lazy = GEMDataFileReader(self.filepath, lazy=True)
+
+        for eager_run, lazy_run in zip(eager.run_info, lazy.run_info):
+            self.assertEqual(lazy_run.hdr, eager_run.hdr)
+
+            if eager_run.windows is None:
+                self.assertIsNone(lazy_run.windows)
+            else:
+                self.assertTrue(np.array_equal(lazy_run.windows, eager_run.windows))
+
+    def test_file_is_closed_between_reads(self):
+        reader = GEMDataFileReader(self.filepath, lazy=True)
+        self.assertFalse(reader.is_open)
+
+        reader.run_info[0].hdr
+        self.assertFalse(reader.is_open)
+
+        reader.run_info[1].windows
+        self.assertFalse(reader.is_open)
+
+        reader.compute_stats()
+        self.assertFalse(reader.is_open)
+
+    def test_runs_are_read_individually(self):
+        reader = GEMDataFileReader(self.filepath, lazy=True)
+
+        self.assertIsNone(reader._window_buffer)
+        self.assertEqual(len(reader.run_info[0].windows), reader.file_hdr['windows'])
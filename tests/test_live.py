@@ -0,0 +1,70 @@
+# test_live.py
+#
+# The live statistics accumulated from streamed windows must match GEMRun.compute_stats on the same data
+
+import io
+import unittest
+
+from contextlib import redirect_stdout
+
+from ..file import GEMDataFileReader
+from ..live import LiveRunStats, validate_windows
+from .util import SyntheticFileTestCase, assert_stats_equal
+
+
+class LiveRunStatsTest(SyntheticFileTestCase):
+    def check_file(self, num_pacing_clicks=0, **kwargs):
+        filepath = self.write_file('live.gdf', **kwargs)
+
+        reader = GEMDataFileReader(filepath, lazy=True)
+
+        for run in reader.run_info:
+            if not reader.is_run_valid(run.krun):
+                continue
+
+            with redirect_stdout(io.StringIO()):
+                run.compute_stats(num_pacing_clicks=num_pacing_clicks)
+
+            # Stream the windows one at a time, as the GEM GUI does
+            live_stats = LiveRunStats(reader.get_valid_tapper_idxs(), tapper_ids=reader.get_valid_tapper_ids(), num_pacing_clicks=num_pacing_clicks)
+
+            for window in run.windows:
+                live_stats.add_window(window['asynchronies'].tolist(), window['next_met_adjust'].item(), met_time=window['met_time'].item())
+
+            stats = live_stats.get_stats()
+
+            self.assertEqual(stats['num_windows'], len(run.windows))
+            self.assertEqual(set(stats['tapper_stats'].keys()), set(run.tapper_stats.keys()))
+
+            for tapper_id, tapper_stats in run.tapper_stats.items():
+                assert_stats_equal(self, stats['tapper_stats'][tapper_id], tapper_stats)
+
+            assert_stats_equal(self, stats['metronome_stats'], run.metronome_stats)
+            assert_stats_equal(self, stats['group_stats'], run.group_stats)
+
+    def test_complete_data(self):
+        self.check_file(num_tappers=4)
+
+    def test_missing_taps(self):
+        self.check_file(num_tappers=3, missing_rate=0.2)
+
+    def test_pacing_clicks(self):
+        self.check_file(num_tappers=2, missing_rate=0.1, num_pacing_clicks=2)
+
+
+class ValidateWindowsTest(unittest.TestCase):
+    def test_valid(self):
+        validate_windows([{'asynchronies': [1, -2.5, -32000, 0], 'next_met_adjust': 3}], [0, 1, 2])
+
+    def test_invalid(self):
+        for windows in [
+            {'asynchronies': [1, 2, 3], 'next_met_adjust': 0},
+            [{'next_met_adjust': 0}],
+            [{'asynchronies': [1, 2, 3]}],
+            [{'asynchronies': [1, 2], 'next_met_adjust': 0}],
+            [{'asynchronies': [1, 'x', 3], 'next_met_adjust': 0}],
+            [{'asynchronies': [1, 2, 3], 'next_met_adjust': None}],
+            [[1, 2, 3]],
+        ]:
+            with self.assertRaises(ValueError):
+                validate_windows(windows, [0, 1, 2])
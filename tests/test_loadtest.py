@@ -0,0 +1,31 @@
+# test_loadtest.py
+#
+# The load test command must not run against what looks like a production deployment
+
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, override_settings
+
+from ..management.commands import gem_loadtest
+
+
+class LoadTestCommandTest(SimpleTestCase):
+    @override_settings(DEBUG=False)
+    def test_refuses_without_debug(self):
+        with mock.patch.object(gem_loadtest, 'run_load_test') as run_load_test:
+            with self.assertRaises(CommandError):
+                call_command('gem_loadtest')
+
+        run_load_test.assert_not_called()
+
+    @override_settings(DEBUG=False)
+    def test_force(self):
+        with mock.patch.object(gem_loadtest, 'run_load_test') as run_load_test:
+            run_load_test.return_value.summary.return_value = []
+            run_load_test.return_value.elapsed = 0
+
+            call_command('gem_loadtest', '--force', '--live-server', stdout=mock.Mock())
+
+        self.assertTrue(run_load_test.call_args.kwargs['live_server'])
@@ -0,0 +1,67 @@
+# test_metronome.py
+#
+# The vectorized metronome report of GEMDataFileReader.check_metronome must agree with GEMRun.verify_metronome_values
+
+import io
+import re
+
+from contextlib import redirect_stdout
+
+from ..file import GEMDataFileReader
+from .util import SyntheticFileTestCase
+
+
+class CheckMetronomeTest(SyntheticFileTestCase):
+    # Get the first failing window and time difference of each run according to verify_metronome_values
+    def get_verify_failures(self, reader):
+        failures = {}
+
+        for krun, run in enumerate(reader.run_info):
+            if not run.hdr:
+                continue
+
+            try:
+                with redirect_stdout(io.StringIO()):
+                    run.verify_metronome_values()
+
+            except ValueError as err:
+                window, time_difference = re.match(r'Window (\d+): .*: (\S+)$', str(err)).groups()
+                failures[krun] = (int(window), float(time_difference))
+
+        return failures
+
+    def check_file(self, **kwargs):
+        filepath = self.write_file('metronome.gdf', **kwargs)
+
+        reader = GEMDataFileReader(filepath, lazy=True)
+        report = reader.check_metronome()
+
+        mismatches = report[report['problem'] == 'met_time_mismatch']
+        first_mismatches = mismatches.groupby('run').first()
+
+        failures = self.get_verify_failures(reader)
+
+        self.assertEqual(set(first_mismatches.index), set(failures.keys()))
+
+        for krun, (window, time_difference) in failures.items():
+            self.assertEqual(first_mismatches.loc[krun, 'window'], window)
+            self.assertAlmostEqual(first_mismatches.loc[krun, 'time_difference'], time_difference)
+
+        missing = report[report['problem'] == 'missing_run']
+        self.assertEqual(sorted(missing['run']), sorted(kwargs.get('missing_runs', [])))
+
+        return report
+
+    def test_valid_file(self):
+        report = self.check_file(metronome_tempo=[120.0, 100.0])
+
+        self.assertTrue(report.empty)
+
+    def test_fractional_beat_tempo(self):
+        # A beat at 110 bpm isn't a whole number of milliseconds, so the rounded metronome times don't check out
+        report = self.check_file(metronome_tempo=[120.0, 110.0])
+
+        self.assertFalse(report.empty)
+
+    def test_missing_runs(self):
+        self.check_file(metronome_tempo=[110.0], missing_runs=[0, 3])
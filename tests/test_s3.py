@@ -0,0 +1,84 @@
+# test_s3.py
+#
+# Ranged reads of GEM data files against a fake S3 backend
+
+import os
+
+import numpy as np
+
+from ..file import GEMDataFileReader
+from .util import SyntheticFileTestCase
+
+
+class FakeS3Object:
+    def __init__(self, key):
+        self.bucket_name = 'gem-data'
+        self.key = key
+        self.e_tag = '"fake"'
+
+
+class FakeS3File:
+    def __init__(self, filepath):
+        with open(filepath, 'rb') as fid:
+            self.data = fid.read()
+
+        self.obj = FakeS3Object(os.path.basename(filepath))
+        self.size = len(self.data)
+        self.ranges = []
+
+    # Stands in for a ranged GET, which returns whatever part of the range lies within the object
+    def fetch(self, start, end=None):
+        self.ranges.append((start, end))
+
+        return self.data[start:end]
+
+
+class S3RangeReaderTest(SyntheticFileTestCase):
+    def open_ranged(self, filepath, cache_dir=None):
+        s3file = FakeS3File(filepath)
+        reader = GEMDataFileReader(s3file, lazy=True, ranged=True, cache_dir=cache_dir, fetch=s3file.fetch)
+        reader.read_file()
+
+        return s3file, reader
+
+    def test_ranged_read_matches_local_read(self):
+        filepath = self.write_file('ranged.gdf', repeats=4, num_tappers=3)
+
+        local = GEMDataFileReader(filepath, lazy=True)
+        local.read_file()
+
+        _, ranged = self.open_ranged(filepath)
+
+        self.assertEqual(ranged.file_hdr, local.file_hdr)
+
+        for local_run, ranged_run in zip(local.run_info, ranged.run_info):
+            self.assertEqual(ranged_run.hdr, local_run.hdr)
+            self.assertTrue(np.array_equal(ranged_run.windows, local_run.windows))
+
+    def test_small_file_is_read_in_one_request(self):
+        filepath = self.write_file('small.gdf', repeats=1)
+
+        s3file, _ = self.open_ranged(filepath)
+
+        self.assertEqual(len(s3file.ranges), 1)
+
+    def test_runs_are_coalesced(self):
+        # Larger than the initial request, so the runs are fetched in one further coalesced request
+        filepath = self.write_file('large.gdf', repeats=50)
+
+        s3file, reader = self.open_ranged(filepath)
+
+        self.assertGreater(os.path.getsize(filepath), reader._source.head_bytes)
+        self.assertEqual(len(s3file.ranges), 2)
+        self.assertTrue(all(end is not None for _, end in s3file.ranges))
+
+    def test_warm_cache_makes_no_requests(self):
+        cache_dir = os.path.join(self.tmpdir.name, 'ranges')
+
+        for name, repeats in [('small.gdf', 1), ('large.gdf', 50)]:
+            filepath = self.write_file(name, repeats=repeats)
+
+            self.open_ranged(filepath, cache_dir=cache_dir)
+            s3file, _ = self.open_ranged(filepath, cache_dir=cache_dir)
+
+            self.assertEqual(s3file.ranges, [])
@@ -0,0 +1,51 @@
+# test_stats.py
+#
+# The vectorized statistics of GEMDataFileReader.compute_stats must match the per-run GEMRun.compute_stats
+
+import io
+
+from contextlib import redirect_stdout
+
+from ..file import GEMDataFileReader
+from .util import SyntheticFileTestCase, assert_stats_equal
+
+
+class ComputeStatsTest(SyntheticFileTestCase):
+    def check_file(self, num_pacing_clicks=0, **kwargs):
+        filepath = self.write_file('stats.gdf', **kwargs)
+
+        vectorized = GEMDataFileReader(filepath, lazy=True)
+        vectorized.compute_stats(num_pacing_clicks=num_pacing_clicks)
+
+        per_run = GEMDataFileReader(filepath, lazy=True)
+
+        with redirect_stdout(io.StringIO()):
+            for run in per_run.run_info:
+                run.compute_stats(num_pacing_clicks=num_pacing_clicks)
+
+        for vectorized_run, run in zip(vectorized.run_info, per_run.run_info):
+            self.assertEqual(set(vectorized_run.tapper_stats.keys()), set(run.tapper_stats.keys()))
+
+            for tapper_id, stats in run.tapper_stats.items():
+                assert_stats_equal(self, vectorized_run.tapper_stats[tapper_id], stats)
+
+            assert_stats_equal(self, vectorized_run.metronome_stats, run.metronome_stats)
+            assert_stats_equal(self, vectorized_run.group_stats, run.group_stats)
+
+    def test_complete_data(self):
+        self.check_file(num_tappers=4)
+
+    def test_missing_taps(self):
+        self.check_file(num_tappers=3, missing_rate=0.2)
+
+    def test_pacing_clicks(self):
+        self.check_file(num_tappers=2, missing_rate=0.1, num_pacing_clicks=2)
+
+    def test_single_tapper(self):
+        self.check_file(num_tappers=1, missing_rate=0.1, num_pacing_clicks=2)
+
+    def test_missing_runs(self):
+        self.check_file(num_tappers=2, missing_rate=0.1, missing_runs=[1, 4])
+
+    def test_mostly_missing_taps(self):
+        self.check_file(num_tappers=3, missing_rate=0.9, windows=6)
@@ -0,0 +1,267 @@
+# test_views.py
+#
+# Request-level tests of the control views, with PyEnsemble's group session lookup replaced by a stand-in
+
+import json
+
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.core.cache import cache
+from django.contrib.sessions.backends.cache import SessionStore
+from django.test import SimpleTestCase, RequestFactory, AsyncRequestFactory, override_settings
+
+from .. import control
+from ..context import publish_context, get_published_context
+from ..live import get_live_lock_key
+
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'gem_control-tests'}}
+
+
+class FakeUser:
+    is_authenticated = True
+    is_active = True
+
+
+class FakeGroupSession:
+    '''
+    Stands in for a PyEnsemble GroupSession, counting the times it is saved
+    '''
+    class States:
+        RUNNING = 'running'
+        EXIT_LOOP = 'exit_loop'
+
+    def __init__(self, pk=1, context=None, params=None, state='running'):
+        self.pk = pk
+        self.context = context if context is not None else {'trial_num': 0, 'state': 'initialized'}
+        self.params = params if params is not None else {}
+        self.state = state
+        self.num_saves = 0
+
+    @property
+    def cache_key(self):
+        return f'groupsession_{self.pk}'
+
+    def save(self, update_fields=None):
+        self.num_saves += 1
+
+    def wait_group_ready_client(self, timeout=None):
+        return True
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ViewTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.session = FakeGroupSession()
+
+        patcher = mock.patch.object(control.group_views, 'get_group_session', return_value=self.session)
+        self.get_group_session = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.object(control, 'record_event')
+        self.record_event = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def prepare(self, request):
+        user = FakeUser()
+
+        async def auser():
+            return user
+
+        request.user = user
+        request.auser = auser
+        request.session = SessionStore()
+        request.session.create()
+
+        return request
+
+    def get(self, path, **params):
+        return self.prepare(RequestFactory().get(path, params))
+
+    def post(self, path, data, **kwargs):
+        return self.prepare(RequestFactory().post(path, data, **kwargs))
+
+    def async_get(self, path, **params):
+        return self.prepare(AsyncRequestFactory().get(path, params))
+
+    def async_post(self, path, data, **kwargs):
+        return self.prepare(AsyncRequestFactory().post(path, data, **kwargs))
+
+
+class GetContextTest(ViewTestCase):
+    def get_context(self, request):
+        with mock.patch.object(control, 'LONG_POLL_TIMEOUT', 0.2):
+            return async_to_sync(control.get_context)(request)
+
+    def test_returns_newer_context(self):
+        published = publish_context(self.session)
+
+        response = self.get_context(self.async_get('/context/', version=published['version']-1))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['version'], published['version'])
+
+    def test_times_out_without_change(self):
+        published = publish_context(self.session)
+
+        response = self.get_context(self.async_get('/context/', version=published['version']))
+
+        self.assertEqual(response.status_code, 204)
+
+    def test_group_session_is_loaded_once(self):
+        published = publish_context(self.session)
+        request = self.async_get('/context/', version=published['version'])
+
+        for _ in range(0, 3):
+            self.get_context(request)
+
+        self.assertEqual(self.get_group_session.call_count, 1)
+
+    def test_publishes_missing_context(self):
+        response = self.get_context(self.async_get('/context/', version=0))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(get_published_context(self.session.pk))
+
+    def test_keeps_published_context(self):
+        self.session.context = {'trial_num': 2, 'state': 'trial:initialized'}
+        publish_context(self.session)
+
+        # A group session loaded before the context was published mustn't overwrite it
+        self.get_group_session.return_value = FakeGroupSession()
+
+        response = self.get_context(self.async_get('/context/', version=0))
+
+        self.assertEqual(json.loads(response.content)['context']['trial_num'], 2)
+
+    def test_no_group_session(self):
+        self.get_group_session.return_value = None
+
+        response = self.get_context(self.async_get('/context/'))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_version(self):
+        response = self.get_context(self.async_get('/context/', version='x'))
+
+        self.assertEqual(response.status_code, 400)
+
+
+class AdvanceTrialTest(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.session.context = {'trial_num': 1, 'state': 'trial:started'}
+
+        for name in ['start_trial', 'end_trial']:
+            patcher = mock.patch.object(control.group_views, name)
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+    def test_advances_with_one_save(self):
+        response = control.advance_trial(self.post('/advance/', {'trial_num': 2, 'params': json.dumps({'tempo': 120})}))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.get_group_session.call_count, 1)
+        self.assertEqual(self.session.num_saves, 1)
+
+        self.assertEqual(self.session.context['trial_num'], 2)
+        self.assertEqual(self.session.context['state'], 'trial:started')
+        self.assertEqual(get_published_context(self.session.pk)['context'], self.session.context)
+
+        control.group_views.start_trial.assert_not_called()
+        control.group_views.end_trial.assert_not_called()
+
+    def test_trial_number_mismatch(self):
+        with self.assertLogs(control.logger, 'WARNING'):
+            response = control.advance_trial(self.post('/advance/', {'trial_num': 5, 'params': '{}'}))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['phase'], 'init_trial')
+
+
+class EndExperimentTest(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        patcher = mock.patch.object(control.group_views, 'end_groupsession', return_value='')
+        self.end_groupsession = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flushes_context(self):
+        publish_context(self.session)
+
+        with mock.patch.object(control, 'flush_context') as flush_context:
+            response = control.end_experiment(self.get('/end/'))
+
+        self.assertEqual(response.status_code, 200)
+        flush_context.assert_called_once_with(self.session)
+        self.end_groupsession.assert_called_once()
+
+    def test_no_group_session(self):
+        self.get_group_session.return_value = None
+
+        response = control.end_experiment(self.get('/end/'))
+
+        self.assertEqual(response.status_code, 200)
+        self.end_groupsession.assert_called_once()
+
+
+class InitExperimentTest(ViewTestCase):
+    def test_invalid_params(self):
+        response = control.init_experiment(self.post('/init/', {'tappers_requested': 2, 'metronome_alpha': '"x"', 'metronome_tempo': '120', 'repeats': 2}))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.session.num_saves, 0)
+
+
+class IngestWindowsTest(ViewTestCase):
+    def ingest(self, packet):
+        return control.ingest_windows(self.post('/windows/', json.dumps(packet), content_type='application/json'))
+
+    def test_ingests_windows(self):
+        self.session.context = {'trial_num': 3, 'state': 'trial:started'}
+
+        response = self.ingest({'windows': [{'asynchronies': [1, -2], 'next_met_adjust': 0}], 'tapper_idxs': [0, 1]})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(json.loads(response.content), {'trial_num': 3, 'num_windows': 1})
+
+    def test_invalid_packets(self):
+        for packet in [[], None, 'windows', {}, {'windows': [], 'trial_num': 'x'}, {'windows': [], 'trial_num': True}, {'windows': [[1, 2]]}]:
+            response = self.ingest(packet)
+
+            self.assertEqual(response.status_code, 400, packet)
+
+    def test_lock_held(self):
+        cache.set(get_live_lock_key(self.session.pk, 1), 'other', 60)
+
+        with mock.patch.object(control.live, 'LIVE_STATS_LOCK_TIMEOUT', 0.05):
+            response = self.ingest({'windows': [], 'trial_num': 1})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(cache.get(get_live_lock_key(self.session.pk, 1)), 'other')
+
+
+class InitTrialAsyncTest(ViewTestCase):
+    def init_trial(self, data):
+        with mock.patch.object(control, 'GROUP_READY_TIMEOUT', 0.1), mock.patch.object(control, 'GROUP_READY_STEP', 0.01):
+            return async_to_sync(control.init_trial_async)(self.async_post('/init/async/', data))
+
+    def test_initializes_trial(self):
+        response = self.init_trial({'trial_num': 1, 'params': json.dumps({'tempo': 120})})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.session.context['state'], 'trial:initialized')
+        self.assertEqual(get_published_context(self.session.pk)['context']['trial_num'], 1)
+
+    def test_group_not_ready(self):
+        with mock.patch.object(self.session, 'wait_group_ready_client', return_value=False):
+            response = self.init_trial({'trial_num': 1, 'params': '{}'})
+
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(self.session.context['state'], 'initialized')
@@ -0,0 +1,35 @@
+# util.py
+#
+# Fixtures shared by the tests
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..synthetic import write_gem_file
+
+
+class SyntheticFileTestCase(unittest.TestCase):
+    '''
+    Test case with a temporary directory, removed after each test, in which synthetic GEM data files are written
+    '''
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    # Write a synthetic GEM data file to the temporary directory. Keyword arguments are passed to write_gem_file.
+    def write_file(self, name='test.gdf', seed=0, **kwargs):
+        filepath = os.path.join(self.tmpdir.name, name)
+        write_gem_file(filepath, seed=seed, **kwargs)
+
+        return filepath
+
+
+# Check that two dicts of statistics are equal, counting NaNs as equal
+def assert_stats_equal(testcase, stats, expected):
+    testcase.assertEqual(set(stats.keys()), set(expected.keys()))
+
+    for key, value in expected.items():
+        testcase.assertTrue(np.isclose(stats[key], value, rtol=1e-12, atol=1e-12, equal_nan=True), f'{key}: {stats[key]} != {value}')
@@ -11,8 +11,15 @@ urlpatterns = [
     path('control/experiment/init/', control.init_experiment, name='init_experiment'),
     path('control/experiment/end/', control.end_experiment, name='end_experiment'),
     path('control/trial/init/', control.init_trial, name='init_trial'),
+    path('control/trial/init/async/', control.init_trial_async, name='init_trial_async'),
+    path('control/trial/schedule/', control.get_schedule, name='get_schedule'),
     path('control/trial/start/', control.start_trial, name='start_trial'),
     path('control/trial/end/', control.end_trial, name='end_trial'),
+    path('control/trial/advance/', control.advance_trial, name='advance_trial'),
     path('control/loop/exit/', control.exit_loop, name='exit_loop'),
+    path('control/trial/windows/', control.ingest_windows, name='ingest_windows'),
+    path('control/trial/live/', control.get_live_stats, name='get_live_stats'),
+    path('control/context/', control.get_context, name='get_context'),
+    path('control/metrics/', control.get_metrics, name='get_metrics'),
 ]
 